@@ -0,0 +1,22 @@
+import json
+
+
+def save(path, results):
+    ''' Writes results, a dict of name: number, to path as JSON. '''
+    with open(path, "w") as file:
+        json.dump(results, file, indent=1, sort_keys=True)
+
+
+def compare(results, path):
+    ''' Prints every result next to the one of the same name in the
+    baseline saved at path, and the change in percent. '''
+    with open(path) as file:
+        baseline = json.load(file)
+    print(f"{'':<40} {'baseline':>12} {'now':>12} {'change':>8}")
+    for name, value in sorted(results.items()):
+        old = baseline.get(name)
+        if not isinstance(old, (int, float)) or not old:
+            print(f"{name:<40} {'':>12} {value:>12.4g}")
+            continue
+        change = (value - old) / old * 100
+        print(f"{name:<40} {old:>12.4g} {value:>12.4g} {change:>+7.1f}%")
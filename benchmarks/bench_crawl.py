@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import tempfile
+import subprocess
+
+from argparse import SUPPRESS, ArgumentParser
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import baseline
+from fake_web import FakeCacheServer, SyntheticWeb
+
+
+def make_config(args, cache_server):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    local = cparser["LOCAL PROPERTIES"]
+    local["SAVE"] = "bench.save"
+    local["STORE"] = args.store
+    local["THREADCOUNT"] = str(args.threads)
+    local["PARSEPROCESSES"] = str(args.parse_processes)
+    local["PAGESTORE"] = ""
+    local["METRICSFILE"] = ""
+    cparser["CRAWLER"]["SEEDURL"] = args.seed_url
+    cparser["CRAWLER"]["POLITENESS"] = str(args.politeness)
+    config = Config(cparser)
+    config.cache_server = cache_server
+    return config
+
+
+def stage_seconds(stage):
+    from utils.metrics import metrics
+    histogram = metrics.histograms.get(
+        ("crawler_stage_seconds", (("stage", stage),)))
+    return histogram.total if histogram else 0.0
+
+
+def crawl(args):
+    # Runs in a child process, so the crawler starts from a clean state
+    # and its CPU time and memory are not mixed with the cache server's.
+    from crawler import Crawler
+    from crawler.async_worker import AsyncWorker
+    from crawler.worker import Worker
+    from utils.metrics import metrics
+    logging.disable(logging.INFO)
+    config = make_config(args, tuple(args.cache_server))
+    crawler = Crawler(
+        config, True,
+        worker_factory=AsyncWorker if args.async_mode else Worker)
+    start = time.perf_counter()
+    crawler.start()
+    elapsed = time.perf_counter() - start
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    pages = sum(
+        count for (name, _), count in metrics.counters.items()
+        if name == "crawler_downloads_total")
+    frontier = sum(
+        stage_seconds(stage) for stage in ("frontier_add", "frontier_mark"))
+    retries = metrics.counters.get(("crawler_retries_total", ()), 0)
+    per_page = 1000 / max(pages, 1)
+    return {
+        "pages": pages,
+        "seconds": elapsed,
+        "pages_per_second": pages / elapsed,
+        "retries": retries,
+        "cpu_ms_per_page": (
+            own.ru_utime + own.ru_stime + children.ru_utime
+            + children.ru_stime) * per_page,
+        "frontier_ms_per_page": frontier * per_page,
+        "store_commit_ms_per_page": stage_seconds("store_commit") * per_page,
+        "parse_ms_per_page": stage_seconds("parse") * per_page,
+        "peak_rss_mib": own.ru_maxrss / 1024,
+        "children_peak_rss_mib": children.ru_maxrss / 1024,
+    }
+
+
+def main(args):
+    web = SyntheticWeb(
+        args.pages, args.hosts, args.fanout, args.trap_density,
+        args.trap_depth, args.page_words, args.seed)
+    server = FakeCacheServer(web, args.latency, error_rate=args.error_rate)
+    args.seed_url = web.seed_url
+    args.cache_server = server.address
+    runs = list()
+    try:
+        for _ in range(args.repeat):
+            # The crawler writes its save, report and log files to the
+            # working directory.
+            with tempfile.TemporaryDirectory() as directory:
+                child = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__),
+                     "--child", json.dumps(vars(args))],
+                    cwd=directory, stdout=subprocess.PIPE, check=True)
+            runs.append(json.loads(child.stdout.splitlines()[-1]))
+    finally:
+        server.close()
+    # The run with the median throughput.
+    runs.sort(key=lambda run: run["pages_per_second"])
+    results = runs[len(runs) // 2]
+    mode = "async" if args.async_mode else "threads"
+    print(
+        f"{args.pages} pages on {args.hosts} hosts, {mode}, "
+        f"{args.threads} workers, {args.parse_processes} parse processes, "
+        f"{args.store} store, median of {args.repeat}")
+    for name, value in results.items():
+        print(f"{name:<28} {value:>12.3f}")
+    if args.baseline:
+        baseline.compare(results, args.baseline)
+    if args.save:
+        baseline.save(args.save, results)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument(
+        "--trap_density", type=float, default=0.01,
+        help="share of the pages that link into a crawler trap")
+    parser.add_argument("--trap_depth", type=int, default=100)
+    parser.add_argument(
+        "--page_words", type=int, default=400,
+        help="median number of words on a page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="seconds the cache server takes to answer")
+    parser.add_argument(
+        "--error_rate", type=float, default=0.0,
+        help="share of the requests the cache server answers with a 503")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--async", dest="async_mode", action="store_true", default=False)
+    parser.add_argument("--parse_processes", type=int, default=0)
+    parser.add_argument("--store", default="log")
+    parser.add_argument("--politeness", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--save", default=None, help="write the results to this JSON file")
+    parser.add_argument(
+        "--baseline", default=None,
+        help="compare the results with this JSON file from --save")
+    parser.add_argument("--child", default=None, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_args = parser.parse_args([])
+        vars(child_args).update(json.loads(args.child))
+        print(json.dumps(crawl(child_args)))
+    else:
+        main(args)
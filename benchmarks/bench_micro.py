@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+import cbor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import baseline
+from fake_web import SyntheticWeb, cache_reply
+
+from utils.config import Config
+from utils.page_parser import parse_page
+from utils.response import Response
+from utils.url_filter import UrlFilter
+from crawler.frontier import Frontier
+import scraper
+
+
+def best_of(repeat, function):
+    # Fastest of repeat runs, the one least disturbed by the rest of the
+    # machine.
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def make_config():
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    local = cparser["LOCAL PROPERTIES"]
+    local["SAVE"] = "bench.save"
+    local["STORE"] = "log"
+    # Only the frontier is measured, nothing is downloaded.
+    local["ROBOTS"] = "false"
+    local["DEDUP"] = "false"
+    return Config(cparser)
+
+
+def bench_tokenize(pages, repeat):
+    texts = [parse_page(page, "auto")[0] for page in pages]
+    elapsed = best_of(
+        repeat, lambda: [scraper.tokenize(text) for text in texts])
+    return elapsed / len(texts) * 1e6
+
+
+def bench_is_valid(urls, repeat):
+    # A new filter for every run, so no verdict is cached yet, and then
+    # the same urls again from the cache.
+    def uncached():
+        url_filter = UrlFilter()
+        for url in urls:
+            url_filter.is_valid(url)
+    url_filter = UrlFilter()
+    for url in urls:
+        url_filter.is_valid(url)
+
+    def cached():
+        for url in urls:
+            url_filter.is_valid(url)
+    return (
+        best_of(repeat, uncached) / len(urls) * 1e6,
+        best_of(repeat, cached) / len(urls) * 1e6)
+
+
+def bench_extract_next_links(urls, replies, repeat):
+    # Responses are built for every run since each one unpickles its
+    # page once.
+    def run():
+        for url, reply in zip(urls, replies):
+            scraper.extract_next_links(url, Response(cbor.loads(reply)))
+    return best_of(repeat, run) / len(urls) * 1e6
+
+
+def bench_add_url(urls, repeat):
+    # New urls, each in its own commit like the links of one page, and
+    # then the same urls again, which only hit the seen set.
+    new_times = list()
+    seen_times = list()
+    for _ in range(repeat):
+        frontier = Frontier(make_config(), True)
+        start = time.perf_counter()
+        for url in urls:
+            frontier.add_url(url)
+        new_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for url in urls:
+            frontier.add_url(url)
+        seen_times.append(time.perf_counter() - start)
+        frontier.close()
+    return (
+        min(new_times) / len(urls) * 1e6, min(seen_times) / len(urls) * 1e6)
+
+
+def main(args):
+    logging.disable(logging.INFO)
+    web = SyntheticWeb(
+        args.pages, args.hosts, args.fanout, page_words=args.page_words,
+        seed=args.seed)
+    urls = [web.url(page) for page in range(args.pages)]
+    pages = [web.page(url) for url in urls]
+    replies = [cache_reply(web, url) for url in urls]
+    links = [
+        link for page in pages for link in parse_page(page, "auto")[1]]
+    results = dict()
+    results["tokenize_us_per_page"] = bench_tokenize(pages, args.repeat)
+    (results["is_valid_us_per_url"],
+     results["is_valid_cached_us_per_url"]) = bench_is_valid(
+        links, args.repeat)
+    results["extract_next_links_us_per_page"] = bench_extract_next_links(
+        urls, replies, args.repeat)
+    # The frontier writes its save and log files to the working directory.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            (results["add_url_us_per_new_url"],
+             results["add_url_us_per_seen_url"]) = bench_add_url(
+                links[:args.add_urls], args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"{args.pages} pages of about {args.page_words} words, "
+        f"{len(links)} links, best of {args.repeat}")
+    for name, value in results.items():
+        print(f"{name:<34} {value:>10.2f}")
+    if args.baseline:
+        baseline.compare(results, args.baseline)
+    if args.save:
+        baseline.save(args.save, results)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--fanout", type=int, default=20)
+    parser.add_argument("--page_words", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--add_urls", type=int, default=5000,
+        help="number of links added to the frontier")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--save", default=None, help="write the results to this JSON file")
+    parser.add_argument(
+        "--baseline", default=None,
+        help="compare the results with this JSON file from --save")
+    args = parser.parse_args()
+    main(args)
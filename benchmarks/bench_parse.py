@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import random
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.page_parser import PARSERS, etree, parse_page
+from scraper import tokenize
+
+
+def make_page(seed, paragraphs=100):
+    # Synthetic page for when no saved pages are given.
+    rand = random.Random(seed)
+    vocab = [
+        "".join(rand.choice("abcdefghijklmnopqrstuvwxyz")
+                for _ in range(rand.randint(2, 9)))
+        for _ in range(3000)]
+    parts = [
+        f"<html><head><title>Page {seed}</title>"
+        f"<style>p {{color: red}}</style><script>var x = 1;</script>"
+        f"</head><body>"]
+    for i in range(paragraphs):
+        words = " ".join(rand.choice(vocab) for _ in range(20))
+        parts.append(f"<p>{words} &amp; <b>bold</b>tail</p>")
+        parts.append(f'<a href="/path/{i}?q={seed}#top">{words[:20]}</a>')
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+
+def load_pages(directory):
+    pages = list()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as file:
+            pages.append(file.read())
+    return pages
+
+
+def main(directory, count, repeat):
+    pages = load_pages(directory) if directory else [
+        make_page(seed) for seed in range(count)]
+    total_bytes = sum(len(page) for page in pages)
+    print(f"{len(pages)} pages, {total_bytes / 2**20:.1f} MiB")
+
+    modes = [mode for mode in PARSERS if mode != "lxml" or etree is not None]
+    expected = [parse_page(page, "bs4") for page in pages]
+    for mode in modes:
+        results = [parse_page(page, mode) for page in pages]
+        for (text, links), (bs4_text, bs4_links) in zip(results, expected):
+            assert tokenize(text) == tokenize(bs4_text), mode
+            assert links == bs4_links, mode
+
+    for mode in modes:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                parse_page(page, mode)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(
+            f"{mode:>6}: {elapsed / len(pages) * 1000:7.2f} ms/page "
+            f"{total_bytes / elapsed / 2**20:7.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--pages", type=str, default=None,
+        help="Directory of saved html pages, one page per file.")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    main(args.pages, args.count, args.repeat)
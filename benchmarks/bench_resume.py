@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import logging
+import tempfile
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import get_urlhash
+from utils.config import Config
+from crawler.frontier import Frontier
+from crawler.pending import PendingIndex
+from crawler.store import open_store
+
+
+def make_config(store, save_file):
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    local = cparser["LOCAL PROPERTIES"]
+    local["SAVE"] = save_file
+    local["STORE"] = store
+    # Only the save file is measured, nothing is downloaded.
+    local["ROBOTS"] = "false"
+    local["DEDUP"] = "false"
+    local["TRAPS"] = "false"
+    return Config(cparser)
+
+
+def make_url(i):
+    return (
+        f"https://www{i % 97}.ics.uci.edu/research/group{i % 1013}/"
+        f"page{i}.html")
+
+
+def write_save_file(config, count, pending_every):
+    # Every pending_every-th url is still to be downloaded, the others are
+    # complete. The pending index is written the way the frontier does.
+    save = open_store(config)
+    index = PendingIndex(config.save_file, True)
+    pending = list()
+    db = getattr(save, "db", save)
+    for i in range(count):
+        url = make_url(i)
+        completed = i % pending_every != 0
+        db[get_urlhash(url)] = (url, completed)
+        if not completed:
+            pending.append(url)
+    save.close()
+    index.rewrite(pending)
+    index.close()
+    return len(pending)
+
+
+def resume(config):
+    # Seconds until the first url can be handed to a worker, and until
+    # the frontier is fully loaded.
+    start = time.perf_counter()
+    frontier = Frontier(config, False)
+    url = frontier.try_get_tbd_url()
+    while url is None:
+        time.sleep(0.001)
+        url = frontier.try_get_tbd_url()
+    first = time.perf_counter() - start
+    if frontier.loader:
+        frontier.loader.join()
+    frontier.seen_loaded.wait()
+    loaded = time.perf_counter() - start
+    queued = sum(len(queue) for queue in frontier.host_queues.values()) + 1
+    return frontier, first, loaded, queued
+
+
+def open_time(config):
+    # Seconds to open the save file alone, which every resume pays.
+    start = time.perf_counter()
+    save = open_store(config)
+    len(save)
+    elapsed = time.perf_counter() - start
+    save.close()
+    return elapsed
+
+
+def bench(store, count, pending_every):
+    config = make_config(store, "bench.save")
+    write_save_file(config, count, pending_every)
+    print(
+        f"{store:>6} {count:>9} urls  opening the save file takes "
+        f"{open_time(config):.2f} s")
+
+    # Without an index, as every resume was before it. This writes it.
+    os.remove(f"{config.save_file}.pending")
+    frontier, first, loaded, queued = resume(config)
+    print(
+        f"{store:>6} {count:>9} urls {queued:>8} pending  full scan     "
+        f"first url {first:7.2f} s  loaded {loaded:7.2f} s")
+    frontier.close()
+
+    # The index without the seen set, as after a crash.
+    os.remove(f"{config.save_file}.seen")
+    frontier, first, loaded, queued = resume(config)
+    print(
+        f"{store:>6} {count:>9} urls {queued:>8} pending  index, crash  "
+        f"first url {first:7.2f} s  loaded {loaded:7.2f} s")
+    frontier.close()
+
+    # The index and the seen set written by close.
+    frontier, first, loaded, queued = resume(config)
+    print(
+        f"{store:>6} {count:>9} urls {queued:>8} pending  index, clean  "
+        f"first url {first:7.2f} s  loaded {loaded:7.2f} s")
+    frontier.close()
+
+
+def main(counts, stores, pending_every):
+    logging.disable(logging.INFO)
+    # The frontier writes its save and log files to the working directory.
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for count in counts:
+            for store in stores:
+                bench(store, count, pending_every)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--counts", type=int, nargs="+", default=[1000000, 5000000])
+    parser.add_argument(
+        "--stores", nargs="+", default=["shelve", "log"])
+    parser.add_argument(
+        "--pending_every", type=int, default=10,
+        help="one in this many urls of the save file is still pending")
+    args = parser.parse_args()
+    main(args.counts, args.stores, args.pending_every)
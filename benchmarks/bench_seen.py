@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import resource
+
+from argparse import ArgumentParser
+from hashlib import sha256
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler.seen import SeenSet
+
+
+def make_hashes(count, salt):
+    return [sha256(f"{salt}/{i}".encode("utf-8")).hexdigest()
+            for i in range(count)]
+
+
+def bench(count, digest_size, bloom):
+    hashes = make_hashes(count, "seen")
+    misses = make_hashes(min(count, 1000000), "miss")
+
+    start = time.perf_counter()
+    seen = SeenSet(digest_size, 1 << 16, count if bloom else 0)
+    seen.update(hashes)
+    insert_time = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux, and includes the test hashes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    lookups = hashes[:len(misses)]
+    start = time.perf_counter()
+    assert all(urlhash in seen for urlhash in lookups)
+    hit_rate = len(lookups) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    false_positives = sum(urlhash in seen for urlhash in misses)
+    miss_rate = len(misses) / (time.perf_counter() - start)
+
+    print(
+        f"{count:>10} urls digest={digest_size:>2} bloom={bloom!s:<5} "
+        f"table={seen.nbytes() / 2**20:8.1f} MiB "
+        f"max_rss={peak / 2**20:8.1f} MiB "
+        f"bytes/url={seen.nbytes() / count:6.1f} "
+        f"insert={count / insert_time:10.0f}/s "
+        f"hit={hit_rate:10.0f}/s miss={miss_rate:10.0f}/s "
+        f"false_positives={false_positives}")
+
+
+def main(counts, digest_sizes):
+    for count in counts:
+        for digest_size in digest_sizes:
+            for bloom in (False, True):
+                bench(count, digest_size, bloom)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--counts", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument(
+        "--digest_sizes", type=int, nargs="+", default=[8, 16])
+    args = parser.parse_args()
+    main(args.counts, args.digest_sizes)
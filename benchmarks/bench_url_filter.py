@@ -0,0 +1,183 @@
+import os
+import re
+import sys
+import time
+import random
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.url_filter import UrlFilter
+
+
+# Copy of scraper.is_valid before the rules moved to utils/url_filter.py,
+# kept to check that the compiled filter gives the same answers.
+def legacy_is_valid(url):
+    # Decide whether to crawl this url or not. 
+    # If you decide to crawl it, return True; otherwise return False.
+    # There are already some conditions that return False.
+
+    # valid domains
+    domains = [".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu", "today.uci.edu/department/information_computer_sciences"]
+    
+    # some things to filter out
+    unwanted_keywords = [
+    "do=", 
+    "action=", 
+    "date=",
+    "upload",
+    "download", 
+    "ical", 
+    "login", 
+    "password", 
+    "export", 
+    "attachment", 
+    "share=",
+    "format=",
+    "makefile", "calendar"
+    ] 
+
+    # dead url patterns
+    dead_url_patterns = [
+        r".*404.*",
+        r".*not-found.*",
+        r".*error.*",
+        r".*page-not-found.*",
+        r".*invalid.*"
+    ]
+
+    
+
+    try:
+        parsed = urlparse(url)
+
+        if parsed.scheme not in set(["http", "https"]):
+            return False
+        
+        if not any(parsed.netloc.endswith(domain) for domain in domains):
+            return False
+        
+        if any(keyword in parsed.path or keyword in parsed.query for keyword in unwanted_keywords):
+            return False
+        
+        if any(re.search(pattern, url) for pattern in dead_url_patterns):
+            return False
+        
+        unwanted_directory_pattern = r"./pdf/."
+
+        if re.search(unwanted_directory_pattern, url.lower()):
+            return False
+        
+        # added more things to check in regex and also made it check if any of these things were in the query or path
+        return (
+            not re.match(r".*\.(/pdf/|calendar|cart|view|edit|facebook.com|.json|ooad|format=|makefile|date=|share=|do=|action=|upload|download|ical|login|password|export|attachment)", parsed.query.lower()) and
+            not re.match(r".*\.(/pdf/|calendar|cart|view|edit|facebook.com|.json|ooad|format=|makefile|date=|share=|do=|action=|upload|download|ical|login|password|export|attachment)", parsed.path.lower()) and
+            not re.match(
+                r".*\.(css|js|bmp|gif|jpe?g|ico"
+                r"|png|tiff?|mid|mp2|mp3|mp4"
+                r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+                r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+                r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+                r"|epub|dll|cnf|tgz|sha1|cpp|h|cc|php|bw|cnt|bam|img"
+                r"|thmx|mso|arff|rtf|jar|csv|txt|defs|inc|odc|sas|ppsx|apk|asp|c|sql"
+                r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", 
+                parsed.query.lower()) and 
+            not re.match(
+            r".*\.(css|js|bmp|gif|jpe?g|ico"
+            + r"|png|tiff?|mid|mp2|mp3|mp4"
+            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|img"
+            + r"|epub|dll|cnf|tgz|sha1|cpp|h|cc|defs|inc|odc|sas|ppsx|apk|asp|c|sql"
+            + r"|thmx|mso|arff|rtf|jar|csv|txt|php"
+            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()))
+
+    except TypeError:
+        print ("TypeError for ", parsed)
+        raise
+
+
+def make_urls(base_urls, count, seed=0):
+    # Mutates real urls into the kind of links found on pages: other
+    # domains, traps, files, mixed case and query strings.
+    rand = random.Random(seed)
+    pieces = [
+        "/pdf/x", "/Calendar", "?do=edit", "?share=twitter", "/file.PDF",
+        "/a.json", "/404", "/Error", "?q=page.php", "/view.html", "/.cart",
+        "/img.JPEG", "?format=txt", "/x.bw", "?x=1.bam", "/events/2019-05",
+        "/~user/", "#frag", "/index.html", ":8080", "/Login",
+        "/papers/report.tex", "/data.txt?", "?action=login"]
+    hosts = [
+        "https://www.ics.uci.edu", "http://vision.ics.uci.edu",
+        "https://www.stat.uci.edu", "https://www.google.com",
+        "ftp://ftp.ics.uci.edu", "https://today.uci.edu",
+        "https://WWW.ICS.UCI.EDU", "https://cs.uci.edu"]
+    urls = list(base_urls)
+    while len(urls) < count:
+        url = rand.choice(base_urls) if base_urls else rand.choice(hosts)
+        if rand.random() < 0.3:
+            url = rand.choice(hosts) + urlparse(url).path
+        for _ in range(rand.randint(0, 3)):
+            url += rand.choice(pieces)
+        urls.append(url)
+    return urls
+
+
+def load_urls(path):
+    if not path or not os.path.exists(path):
+        return list()
+    with open(path) as file:
+        return [line.strip() for line in file if line.startswith("http")]
+
+
+def main(path, count, repeat):
+    urls = make_urls(load_urls(path), count)
+    url_filter = UrlFilter()
+
+    mismatches = [
+        url for url in urls if legacy_is_valid(url) != url_filter.is_valid(url)]
+    for url in mismatches[:20]:
+        print(f"MISMATCH {url}: legacy={legacy_is_valid(url)}")
+    print(
+        f"{len(urls)} urls, {sum(map(legacy_is_valid, urls))} valid, "
+        f"{len(mismatches)} mismatches")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            legacy_is_valid(url)
+    legacy_time = (time.perf_counter() - start) / repeat
+
+    uncached = UrlFilter(cache_size=0)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            uncached.is_valid(url)
+    uncached_time = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url in urls:
+            url_filter.is_valid(url)
+    cached_time = (time.perf_counter() - start) / repeat
+
+    for name, elapsed in (
+            ("legacy", legacy_time), ("compiled", uncached_time),
+            ("compiled+lru", cached_time)):
+        print(
+            f"{name:>13}: {elapsed / len(urls) * 1e6:6.2f} us/url "
+            f"({legacy_time / elapsed:5.1f}x)")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--urls", type=str, default="unique_urls.txt",
+        help="File with one url per line to build the test set from.")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(0 if main(args.urls, args.count, args.repeat) else 1)
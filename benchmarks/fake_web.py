@@ -0,0 +1,161 @@
+import pickle
+import random
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cbor
+import requests
+
+
+class SyntheticWeb(object):
+    ''' A deterministic web of pages spread over hosts of ics.uci.edu.
+
+    Page i links to pages 2i + 1 and 2i + 2, so every page is reachable
+    from page 0, and to fanout - 2 more pages picked at random. One in
+    1 / trap_density pages also links into a crawler trap: an archive
+    that goes trap_depth pages deep, each linking to the next. Pages have
+    about page_words words of text drawn from a fixed vocabulary, so word
+    counts look like those of real pages. Everything depends only on
+    seed, so runs can be compared. '''
+    def __init__(self, pages=2000, hosts=20, fanout=8, trap_density=0.01,
+                 trap_depth=100, page_words=400, seed=0):
+        self.pages = pages
+        self.hosts = hosts
+        self.fanout = fanout
+        self.trap_density = trap_density
+        self.trap_depth = trap_depth
+        self.page_words = page_words
+        self.seed = seed
+        rand = random.Random(seed)
+        self.vocabulary = [
+            "".join(rand.choice("abcdefghijklmnopqrstuvwxyz")
+                    for _ in range(rand.randint(2, 10)))
+            for _ in range(20000)]
+
+    def url(self, page):
+        return f"https://h{page % self.hosts}.ics.uci.edu/page/{page}"
+
+    def trap_url(self, page, depth):
+        return (
+            f"https://h{page % self.hosts}.ics.uci.edu/archive/{page}/"
+            f"{depth}")
+
+    @property
+    def seed_url(self):
+        return self.url(0)
+
+    def _words(self, rand):
+        count = max(20, int(rand.lognormvariate(0, 0.5) * self.page_words))
+        # Zipf like: earlier words of the vocabulary are far more common.
+        return " ".join(
+            self.vocabulary[int(len(self.vocabulary) * rand.random() ** 3)]
+            for _ in range(count))
+
+    def _links(self, page, rand):
+        links = [
+            self.url(child) for child in (2 * page + 1, 2 * page + 2)
+            if child < self.pages]
+        links.extend(
+            self.url(rand.randrange(self.pages))
+            for _ in range(max(0, self.fanout - 2)))
+        if self.trap_density and rand.random() < self.trap_density:
+            links.append(self.trap_url(page, 0))
+        return links
+
+    def page(self, url):
+        ''' The html of url, or None if it is not a page of this web. '''
+        path = urlparse(url).path.strip("/").split("/")
+        try:
+            if len(path) == 2 and path[0] == "page":
+                page = int(path[1])
+                if not 0 <= page < self.pages:
+                    return None
+                rand = random.Random(f"{self.seed}-{page}")
+                links = self._links(page, rand)
+            elif len(path) == 3 and path[0] == "archive":
+                page, depth = int(path[1]), int(path[2])
+                rand = random.Random(f"{self.seed}-{page}-{depth}")
+                links = (
+                    [self.trap_url(page, depth + 1)]
+                    if depth + 1 < self.trap_depth else [])
+            else:
+                return None
+        except ValueError:
+            return None
+        anchors = "".join(f'<a href="{link}">link</a>' for link in links)
+        return (
+            f"<html><head><title>{url}</title></head><body>"
+            f"<p>{self._words(rand)}</p>{anchors}</body></html>"
+        ).encode("utf-8")
+
+
+def cache_reply(web, url):
+    ''' The reply of the cache server for url, a CBOR map with the url,
+    the status and the pickled requests.Response of the page, as
+    utils/download.py reads it. robots.txt allows everything. '''
+    if urlparse(url).path == "/robots.txt":
+        body, status = b"User-agent: *\nDisallow:\n", 200
+    else:
+        body = web.page(url)
+        status = 200 if body is not None else 404
+    resp = requests.models.Response()
+    resp._content = body or b""
+    resp.status_code = status
+    resp.url = url
+    resp.headers["Content-Type"] = "text/html"
+    return cbor.dumps(
+        {"url": url, "status": status, "response": pickle.dumps(resp)})
+
+
+class FakeCacheServer(object):
+    ''' Local stand-in for the cache server, answering every request
+    with the cache_reply of a SyntheticWeb. Every reply is delayed by
+    latency seconds, like the round trip to the real cache server, and
+    error_rate of the requests get a 503 instead, like an overloaded
+    one. '''
+    def __init__(self, web, latency=0.0, port=0, error_rate=0.0):
+        self.web = web
+        self.latency = latency
+        self.error_rate = error_rate
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def _handler(self):
+        server = self
+
+        class CacheHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = parse_qs(urlparse(self.path).query)["q"][0]
+                if server.latency:
+                    time.sleep(server.latency)
+                if random.random() < server.error_rate:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = cache_reply(server.web, url)
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        return CacheHandler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
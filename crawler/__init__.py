@@ -1,18 +1,50 @@
 from utils import get_logger
 from crawler.frontier import Frontier
 from crawler.worker import Worker
+from crawler.pipeline import ParseStage
+from crawler.report import Report
+from crawler.page_store import PageStore
+from crawler.metrics import MetricsExporter
+from crawler.link_graph import LinkRecorder
+from utils import download
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        if config.url_filter is not None:
+            scraper.url_filter = config.url_filter
         self.frontier = frontier_factory(config, restart)
+        scraper.dedup_index = getattr(self.frontier, "dedup", None)
+        scraper.trap_detector = getattr(self.frontier, "traps", None)
+        self.link_graph = (
+            LinkRecorder(config.link_graph, restart)
+            if config.link_graph else None)
+        scraper.link_graph = self.link_graph
+        # The shards of a sharded crawl count the urls of their own hosts.
+        shards = getattr(self.frontier, "shards", None)
+        self.report = Report(config, restart, shards.owns if shards else None)
+        # Every downloaded page is also kept for launch.py --replay.
+        self.page_store = (
+            PageStore(config.page_store, config.page_segment_size)
+            if config.page_store else None)
+        download.page_store = self.page_store
         self.workers = list()
         self.worker_factory = worker_factory
+        self.parse_stage = (
+            ParseStage(config.parse_processes, config.parse_queue)
+            if config.parse_processes > 0 else None)
+        self.metrics = MetricsExporter(config, self.frontier)
 
     def start_async(self):
+        # Workers only get a parse stage when one is configured, so worker
+        # factories without the parse_stage argument keep working.
+        kwargs = (
+            {"parse_stage": self.parse_stage} if self.parse_stage else {})
         self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
+            self.worker_factory(
+                worker_id, self.config, self.frontier, **kwargs)
             for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
@@ -24,3 +56,21 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        try:
+            if self.parse_stage:
+                self.parse_stage.shutdown()
+            self.report.finish()
+            self.metrics.finish()
+        finally:
+            # The crawl state is saved even if the report or the metrics
+            # fail. Frontiers without close keep nothing to save.
+            close = getattr(self.frontier, "close", None)
+            if close is not None:
+                close()
+            if self.link_graph:
+                scraper.link_graph = None
+                self.link_graph.close()
+            if self.page_store:
+                download.page_store = None
+                self.page_store.close()
+
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from crawler.throttle import is_failure
+from crawler.worker import Worker
+from utils.async_download import CacheConnectionPool, async_download
+
+# Longest a task waits before polling the frontier again, in case another
+# worker thread made a host ready.
+MAX_POLL_INTERVAL = 0.5
+
+
+class AsyncWorker(Worker):
+    ''' Worker that runs config.async_tasks crawl tasks on one asyncio
+    event loop, sharing keep-alive connections to the cache server.
+
+    Hundreds of downloads can be in flight from a single thread. The
+    frontier still enforces politeness per host; the tasks poll it with
+    try_get_tbd_url instead of blocking the loop in get_tbd_url. Pages
+    are scraped, or handed to a full parse stage, in the default executor
+    of the loop, so the other downloads go on meanwhile. '''
+    @property
+    def concurrency(self):
+        return self.config.async_tasks
+
+    def run(self):
+        asyncio.run(self._crawl())
+        self.logger.info("Frontier is empty. Stopping Crawler.")
+
+    async def _crawl(self):
+        host, port = self.config.cache_server
+        pool = CacheConnectionPool(
+            host, port, self.config.async_tasks, self.config.max_page_size)
+        # Notified whenever a task of this loop marks a url complete, since
+        # that can release a host or add new urls.
+        self.progress = asyncio.Condition()
+        self.loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(
+                self._crawl_task(pool)
+                for _ in range(self.config.async_tasks)))
+        finally:
+            pool.close()
+
+    async def _crawl_task(self, pool):
+        while True:
+            tbd_url = self.frontier.try_get_tbd_url()
+            if tbd_url is None:
+                if self.frontier.is_finished():
+                    break
+                delay = self.frontier.next_ready_delay()
+                await self._wait_progress(
+                    MAX_POLL_INTERVAL if delay is None else
+                    min(delay, MAX_POLL_INTERVAL))
+                continue
+            if self.throttle is not None:
+                # Slots are released by the tasks of this loop, or of the
+                # other worker threads, which are not notified here.
+                while not self.throttle.try_acquire():
+                    await self._wait_progress(MAX_POLL_INTERVAL)
+            start = time.perf_counter()
+            try:
+                resp = await async_download(
+                    tbd_url, self.config, pool, self.logger)
+                status = resp.status
+            except Exception:
+                self.logger.exception(f"Failed to download {tbd_url}.")
+                resp, status = None, "error"
+            finally:
+                if self.throttle is not None:
+                    self.throttle.release()
+            self.record_download(tbd_url, status, start)
+            # Both take the frontier lock and commit the store, off the
+            # event loop so the other downloads go on meanwhile.
+            if is_failure(status):
+                await self.loop.run_in_executor(
+                    None, self.download_failed, tbd_url)
+            else:
+                await self.loop.run_in_executor(
+                    None, self.handle_response, tbd_url, resp)
+            async with self.progress:
+                self.progress.notify_all()
+
+    async def _wait_progress(self, timeout):
+        async with self.progress:
+            try:
+                await asyncio.wait_for(self.progress.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
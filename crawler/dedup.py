@@ -0,0 +1,125 @@
+import os
+import struct
+from threading import Lock
+
+from utils import get_logger
+from utils.simhash import hash64
+
+# Each record of the fingerprint file is the id of the url, the content
+# hash and the simhash of its page. Files written before the url ids do
+# not start with HEADER and hold only the two hashes per record.
+HEADER = b"DEDUP2\n\0"
+RECORD = struct.Struct("<QQQ")
+OLD_RECORD = struct.Struct("<QQ")
+
+
+class DuplicateIndex(object):
+    ''' Exact and near duplicate detection over page fingerprints.
+
+    A page is an exact duplicate when its content hash was seen before,
+    and a near duplicate when a seen simhash is at most max_distance bits
+    away. The simhash is split into max_distance + 1 bands, and any two
+    fingerprints that close agree on at least one whole band, so only the
+    fingerprints sharing a band have to be compared.
+
+    The fingerprint of each url is kept with it, so a page downloaded
+    again by a recrawl is not a duplicate of its own last version, which
+    it replaces. Fingerprints of unique pages are appended to path and
+    loaded again when the crawl resumes. '''
+    def __init__(self, path, restart, max_distance=3):
+        self.logger = get_logger("DEDUP")
+        self.path = path
+        self.max_distance = max_distance
+        self.band_count = max_distance + 1
+        self.band_bits = 64 // self.band_count
+        self.band_mask = (1 << self.band_bits) - 1
+        self.hashes = set()
+        self.bands = [dict() for _ in range(self.band_count)]
+        # url id: (content hash, simhash) of its page
+        self.pages = dict()
+        self.lock = Lock()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path) and os.path.getsize(path):
+            self._load()
+        else:
+            with open(path, "wb") as file:
+                file.write(HEADER)
+        self.file = open(path, "ab")
+
+    def _load(self):
+        with open(self.path, "rb") as file:
+            data = file.read()
+        if data.startswith(HEADER):
+            data = data[len(HEADER):]
+            usable = len(data) - len(data) % RECORD.size
+            for url_id, page_hash, fingerprint in RECORD.iter_unpack(
+                    data[:usable]):
+                self._replace(url_id, page_hash, fingerprint)
+        else:
+            # The pages of these fingerprints are unknown, url id 0.
+            usable = len(data) - len(data) % OLD_RECORD.size
+            for page_hash, fingerprint in OLD_RECORD.iter_unpack(
+                    data[:usable]):
+                self._add(page_hash, fingerprint)
+        self.logger.info(
+            f"Loaded {len(self.hashes)} page fingerprints from {self.path}.")
+
+    def _band_keys(self, fingerprint):
+        for band in range(self.band_count):
+            yield band, (fingerprint >> (band * self.band_bits)) & self.band_mask
+
+    def _add(self, page_hash, fingerprint):
+        self.hashes.add(page_hash)
+        for band, key in self._band_keys(fingerprint):
+            self.bands[band].setdefault(key, list()).append(fingerprint)
+
+    def _remove(self, page_hash, fingerprint):
+        self.hashes.discard(page_hash)
+        for band, key in self._band_keys(fingerprint):
+            bucket = self.bands[band][key]
+            bucket.remove(fingerprint)
+            if not bucket:
+                del self.bands[band][key]
+
+    def _replace(self, url_id, page_hash, fingerprint):
+        old = self.pages.get(url_id)
+        if old is not None:
+            self._remove(*old)
+        self.pages[url_id] = (page_hash, fingerprint)
+        self._add(page_hash, fingerprint)
+
+    def _near(self, fingerprint):
+        for band, key in self._band_keys(fingerprint):
+            for other in self.bands[band].get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return True
+        return False
+
+    def check_and_add(self, url, page_hash, fingerprint):
+        ''' Returns True if the page duplicates one of another url seen
+        before, otherwise records its fingerprint as the one of url and
+        returns False. '''
+        url_id = hash64(url.encode("utf-8"))
+        with self.lock:
+            # The last version of the page of url is left out of the check.
+            old = self.pages.get(url_id)
+            if old is not None:
+                self._remove(*old)
+            reason = (
+                "exact duplicate" if page_hash in self.hashes else
+                "near duplicate" if self._near(fingerprint) else None)
+            if reason is not None:
+                if old is not None:
+                    self._add(*old)
+                self.logger.info(f"Skipping {url}, {reason}.")
+                return True
+            self.pages[url_id] = (page_hash, fingerprint)
+            self._add(page_hash, fingerprint)
+            self.file.write(RECORD.pack(url_id, page_hash, fingerprint))
+            self.file.flush()
+            return False
+
+    def close(self):
+        with self.lock:
+            self.file.close()
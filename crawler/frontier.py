@@ -1,75 +1,574 @@
 import os
-import shelve
+import time
+import heapq
 
-from threading import Thread, RLock
+from collections import deque
+from threading import Thread, RLock, Condition, Event
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
-from utils import get_logger, get_urlhash, normalize
+from utils import get_logger, get_urlhash
+from utils.canonical import canonicalize_with_hash
+from utils.metrics import metrics
 from scraper import is_valid
+from crawler.store import get_store_class, open_store
+from crawler.seen import SeenSet
+from crawler.pending import PendingIndex
+from crawler.dedup import DuplicateIndex
+from crawler.traps import TrapDetector
+from crawler.robots import RobotsCache
+from crawler.shards import ShardExchange
+from crawler.recrawl import RecrawlPolicy
+from crawler.throttle import Throttle
+from crawler.link_graph import LinkRanks
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
+
+        # One queue of urls per host (netloc), and a heap of
+        # (ready_time, host) entries for hosts that have queued urls and
+        # are not currently being downloaded from.
+        self.host_queues = dict()
+        self.host_ready_time = dict()
+        self.ready_heap = list()
+        self.scheduled_hosts = set()
+        self.busy_hosts = set()
+        # Urls handed out by get_tbd_url that are not yet marked complete.
+        # Workers wait instead of stopping while there are any, since
+        # those urls can still produce new links.
+        self.in_flight = set()
+        self.lock = Condition(RLock())
+        # robots.txt rules of the hosts. A host whose rules are not cached
+        # stays out of ready_heap, in robots_hosts, until they arrive.
+        self.robots = (
+            RobotsCache(
+                config, self._robots_fetched, config.robots_ttl,
+                config.robots_threads)
+            if config.robots else None)
+        self.robots_hosts = set()
+
+        store_class = get_store_class(self.config)
+        if not store_class.exists(self.config.save_file) and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif store_class.exists(self.config.save_file) and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            store_class.remove(self.config.save_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
-            for url in self.config.seed_urls:
-                self.add_url(url)
+        self.save = open_store(self.config)
+        resume = not restart and len(self.save) > 0
+        # The urls of the save file that are still to be downloaded, so a
+        # resume does not have to read the whole save file.
+        self.pending = PendingIndex(self.config.save_file, not resume)
+        # Save files from before utils/canonical.py hold urls in their old
+        # normal form, under its hash. The canonical hashes of their urls
+        # are added to seen once when resuming them, and the marker file
+        # tells the save files that do not need it.
+        self.canonical_path = f"{self.config.save_file}.canonical"
+        self.rehash = resume and not os.path.exists(self.canonical_path)
+        if not resume:
+            self._mark_canonical()
+        # In memory set of every url hash in the save file, so add_urls
+        # does not look up the store for every discovered link. It is
+        # written next to the save file by close and loaded on resume;
+        # after a crash it is built from the keys of the save file.
+        # add_urls waits for seen_loaded.
+        self.seen_path = f"{self.config.save_file}.seen"
+        self.seen_loaded = Event()
+        self.seen = None
+        if resume and not self.rehash and os.path.exists(self.seen_path):
+            seen = SeenSet.load(self.seen_path)
+            if seen.digest_size == self.config.seen_digest_size:
+                self.seen = seen
+                self.seen_loaded.set()
+        if os.path.exists(self.seen_path):
+            # Only valid until the crawl changes the save file.
+            os.remove(self.seen_path)
+        if self.seen is None:
+            self.seen = SeenSet(
+                self.config.seen_digest_size, max(len(self.save), 1 << 16),
+                self.config.bloom_capacity)
+        if not resume:
+            self.seen_loaded.set()
+        # Fingerprints of the pages crawled so far, kept next to the save
+        # file so duplicate detection survives a resume.
+        self.dedup = (
+            DuplicateIndex(
+                f"{self.config.save_file}.dedup", restart,
+                self.config.dedup_distance)
+            if self.config.dedup else None)
+        # Budgets and yield of url templates, checked before a new url is
+        # queued so crawler traps do not fill the frontier.
+        self.traps = (
+            TrapDetector(
+                self.config.trap_log, restart, self.config.trap_host_budget,
+                self.config.trap_template_budget,
+                self.config.trap_query_budget, self.config.trap_min_yield,
+                self.config.trap_window, self.config.trap_throttle)
+            if self.config.traps else None)
+        # Written by close and loaded on resume; after a crash the loader
+        # counts the urls of the save file again.
+        self.traps_path = f"{self.config.save_file}.traps"
+        self.traps_loaded = False
+        if self.traps and resume and os.path.exists(self.traps_path):
+            self.traps.load(self.traps_path)
+            self.traps_loaded = True
+        if os.path.exists(self.traps_path):
+            os.remove(self.traps_path)
+        # The validators and content hash of every downloaded page are
+        # saved with it, so config.recrawl can download again the pages
+        # that are due and skip the ones that did not change. visits holds
+        # the Visit of each downloaded url until it is marked complete,
+        # and revisits the previous Visit of each url queued again.
+        self.recrawl = RecrawlPolicy(
+            self.config.recrawl_min_interval,
+            self.config.recrawl_max_interval,
+            self.config.recrawl_interval)
+        self.visits = dict()
+        self.revisits = dict()
+        # Download slots and host backoff, shared with the workers, and the
+        # retries of each url whose download failed.
+        self.throttle = Throttle(
+            self.config.adaptive_concurrency, self.config.latency_target,
+            self.config.backoff_max, self.config.retry_budget)
+        self.retries = dict()
+        # PageRank of the urls in the last launch.py --analyze, the pending
+        # urls of every host are put in its order once they are loaded.
+        self.ranks = None
+        ranks_path = f"{self.config.link_graph}.ranks.npz"
+        if (resume and self.config.link_graph and self.config.link_priority
+                and os.path.exists(ranks_path)):
+            self.ranks = LinkRanks.load(ranks_path)
+        # True while the loader thread is still queueing pending urls, the
+        # workers do not stop meanwhile.
+        self.loading = False
+        self.loader = None
+        # With several shards, only the urls of the hosts of this shard are
+        # queued here, the others are sent to their shards.
+        self.shards = (
+            ShardExchange(
+                config, self.add_urls, self.is_idle, self._shards_finished)
+            if config.shard_count > 1 else None)
+        if not resume:
+            self._add_seed_urls()
+        elif self.pending.found:
+            # Workers start on the first pending urls while the rest are
+            # read in the background.
+            self.loading = True
+            self.loader = Thread(target=self._load_pending, daemon=True)
+            self.loader.start()
         else:
-            # Set the frontier state with contents of save file.
+            # A save file from before the pending index: set the frontier
+            # state with its contents and write the index once.
             self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+            self.pending.rewrite(
+                url for queue in self.host_queues.values() for url in queue)
+            self.seen.update(self.save.keys())
+            if self.rehash:
+                self._add_canonical_hashes()
+            self.seen_loaded.set()
+            if self.config.recrawl:
+                self._requeue_due()
+            self._prioritize()
+        if self.shards:
+            self.shards.start()
+
+    def _add_seed_urls(self):
+        # The urls of the sitemaps of the seed hosts are added with the
+        # seeds, all in one commit. Every shard adds the seeds of its own
+        # hosts.
+        urls = [
+            url for url in self.config.seed_urls
+            if not self.shards or self.shards.owns(url)]
+        if self.robots and self.config.sitemap_urls:
+            for seed_url in list(urls):
+                parsed = urlparse(seed_url)
+                try:
+                    urls.extend(
+                        url for url in self.robots.sitemap_urls(
+                            parsed.netloc, parsed.scheme,
+                            self.config.sitemap_urls)
+                        if is_valid(url))
+                except Exception:
+                    self.logger.exception(
+                        f"Failed to get the sitemaps of {parsed.netloc}.")
+        if self.shards:
+            # Not found on pages, so not counted as unique urls.
+            urls = self.shards.route(urls, counted=False)
+        self.add_urls(urls)
 
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+        self.save is the store picked by the STORE option (see
+        crawler/store.py), so both backends are read the same way here. '''
         total_count = len(self.save)
         tbd_count = 0
-        for url, completed in self.save.values():
+        for url, completed, *_ in self.save.values():
+            if self.traps:
+                self.traps.count(url)
             if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
+                self._enqueue(url)
                 tbd_count += 1
         self.logger.info(
             f"Found {tbd_count} urls to be downloaded from {total_count} "
             f"total urls discovered.")
 
-    def get_tbd_url(self):
+    def _load_pending(self):
+        # Queues the urls of the pending index chunk by chunk, then builds
+        # seen if it was not written by the last close.
         try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+            rebuild = not self.seen_loaded.is_set()
+            if self.traps and not self.traps_loaded:
+                with self.lock:
+                    saved = [url for url, *_ in self.save.values()]
+                for url in saved:
+                    self.traps.count(url)
+                self.logger.info(
+                    f"Rebuilt the trap counters from {len(saved)} urls of "
+                    f"{self.config.save_file}.")
+            tbd_count = 0
+            for chunk in self.pending.iter_pending(get_urlhash):
+                if rebuild:
+                    # After a crash the index may hold urls whose records
+                    # were still in the group commit of a LogStore. They
+                    # are queued again, so they must be seen too.
+                    self.seen.update(get_urlhash(url) for url in chunk)
+                if self.traps and not self.traps_loaded:
+                    # Pending urls missing from the save file were not
+                    # counted above. They are not queued yet, so none of
+                    # them was saved since.
+                    with self.lock:
+                        unsaved = [
+                            url for url in chunk
+                            if get_urlhash(url) not in self.save]
+                    for url in unsaved:
+                        self.traps.count(url)
+                urls = [url for url in chunk if is_valid(url)]
+                if self.shards:
+                    # Hosts move to other shards when SHARDS changes.
+                    urls = self.shards.route(urls)
+                with self.lock:
+                    for url in urls:
+                        self._enqueue(url)
+                tbd_count += len(urls)
+            self.logger.info(
+                f"Found {tbd_count} urls to be downloaded in the pending "
+                f"index of {self.config.save_file}.")
+            if self.config.recrawl:
+                self._requeue_due()
+            self._prioritize()
+            if rebuild:
+                # Workers write to the save file meanwhile, so its keys
+                # are copied under the lock.
+                with self.lock:
+                    keys = list(self.save.keys())
+                self.seen.update(keys)
+                if self.rehash:
+                    self._add_canonical_hashes()
+                self.logger.info(
+                    f"Rebuilt the seen urls from {len(self.seen)} keys of "
+                    f"{self.config.save_file}.")
+        except Exception:
+            self.logger.exception("Failed to load the pending urls.")
+        finally:
+            self.seen_loaded.set()
+            with self.lock:
+                self.loading = False
+                self.lock.notify_all()
+
+    def _mark_canonical(self):
+        with open(self.canonical_path, "w"):
+            pass
+
+    def _add_canonical_hashes(self):
+        # Links to the urls of an older save file are canonical, so their
+        # hashes can differ from the keys.
+        with self.lock:
+            urls = [url for url, *_ in self.save.values()]
+        self.seen.update(canonicalize_with_hash(url)[1] for url in urls)
+        self._mark_canonical()
+        self.logger.info(
+            f"Added the canonical hashes of {len(urls)} urls of "
+            f"{self.config.save_file} to the seen urls.")
+
+    def _requeue_due(self):
+        # Queues again the completed urls whose next visit is due. The
+        # save file is read under the lock since workers are running.
+        now = time.time()
+        with self.lock:
+            due = list()
+            for url, completed, *visit in self.save.values():
+                visit = visit[0] if visit else None
+                if (completed and self.recrawl.is_due(visit, now)
+                        and is_valid(url)):
+                    due.append((url, visit))
+            for url, visit in due:
+                urlhash = get_urlhash(url)
+                self.save[urlhash] = (url, False, visit)
+                self.revisits[urlhash] = visit
+                self._enqueue(url)
+            self.save.commit()
+            self.pending.add([url for url, _ in due])
+        self.logger.info(f"Queued {len(due)} urls due for a recrawl.")
+
+    def _prioritize(self):
+        # Puts the queue of every host in order of PageRank, highest first.
+        if self.ranks is None:
+            return
+        with self.lock:
+            for host, queue in self.host_queues.items():
+                if len(queue) > 1:
+                    self.host_queues[host] = deque(
+                        self.ranks.sort(list(queue)))
+        self.logger.info(
+            f"Ordered the queued urls by the PageRank of "
+            f"{len(self.ranks.ids)} urls.")
+
+    def _enqueue(self, url):
+        # Queue the url under its host and schedule the host if it is
+        # neither waiting in the heap nor being downloaded from.
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_queues:
+                self.host_queues[host] = deque()
+            self.host_queues[host].append(url)
+            self._schedule_host(host)
+
+    def _schedule_host(self, host):
+        if host in self.scheduled_hosts or host in self.busy_hosts:
+            return
+        if not self.host_queues.get(host):
+            return
+        if self.robots and self.robots.get(host) is None:
+            # Scheduled by _robots_fetched once the rules are cached.
+            if host not in self.robots_hosts:
+                self.robots_hosts.add(host)
+                self.robots.request(
+                    host, urlparse(self.host_queues[host][0]).scheme)
+            return
+        ready_time = self.host_ready_time.get(host, 0)
+        heapq.heappush(self.ready_heap, (ready_time, host))
+        self.scheduled_hosts.add(host)
+        self.lock.notify()
+
+    def get_tbd_url(self):
+        ''' Returns the url of the host that is eligible soonest, waiting
+        for its politeness delay if needed. Returns None only when there
+        is nothing queued and no other worker is still downloading. '''
+        with self.lock:
+            while True:
+                url = self.try_get_tbd_url()
+                if url is not None:
+                    return url
+                if self.is_finished():
+                    # Wake up the other waiting workers so they stop too.
+                    self.lock.notify_all()
+                    return None
+                self.lock.wait(self.next_ready_delay())
+
+    def try_get_tbd_url(self):
+        ''' Non blocking get_tbd_url: returns None if no host is past its
+        politeness delay right now. '''
+        with self.lock:
+            if not self.ready_heap or self.ready_heap[0][0] > time.time():
+                return None
+            _, host = heapq.heappop(self.ready_heap)
+            self.scheduled_hosts.discard(host)
+            queue = self.host_queues[host]
+            url = queue.popleft()
+            if not queue:
+                del self.host_queues[host]
+            self.busy_hosts.add(host)
+            self.in_flight.add(url)
+            return url
+
+    def next_ready_delay(self):
+        ''' Seconds until the next queued host is ready, or None if no
+        host is queued and only downloads in flight can add one. '''
+        with self.lock:
+            if not self.ready_heap:
+                return None
+            return max(0, self.ready_heap[0][0] - time.time())
+
+    def is_idle(self):
+        ''' True if nothing is queued or downloading in this frontier. '''
+        with self.lock:
+            return (
+                not self.ready_heap and not self.in_flight
+                and not self.robots_hosts and not self.loading)
+
+    def is_finished(self):
+        if self.shards and not self.shards.finished.is_set():
+            return False
+        return self.is_idle()
+
+    def _shards_finished(self):
+        # Wake up the waiting workers so they see the crawl is finished.
+        with self.lock:
+            self.lock.notify_all()
+
+    def _robots_fetched(self, host):
+        # Drops the queued urls the rules disallow and schedules the host
+        # after its crawl delay, since getting robots.txt was a download.
+        with self.lock:
+            self.robots_hosts.discard(host)
+            queue = self.host_queues.get(host)
+            if queue:
+                allowed = deque(
+                    url for url in queue if self.robots.allowed(url, host))
+                if len(allowed) < len(queue):
+                    self.logger.info(
+                        f"Dropped {len(queue) - len(allowed)} urls of {host} "
+                        f"disallowed by its robots.txt.")
+                if allowed:
+                    self.host_queues[host] = allowed
+                else:
+                    del self.host_queues[host]
+            self.host_ready_time[host] = time.time() + self._delay(host)
+            self._schedule_host(host)
+            self.lock.notify_all()
+
+    def _delay(self, host):
+        delay = self.config.time_delay
+        if self.robots:
+            delay = max(delay, self.robots.crawl_delay(host))
+        return self.throttle.host_delay(host, delay)
 
     def add_url(self, url):
-        url = normalize(url)
+        self.add_urls([url])
+
+    def add_urls(self, urls):
+        ''' Adds all the links of a page with one commit and one write. '''
+        # Aliases of a url have its canonical form and hash, so they are
+        # only queued once, and belong to the shard of its canonical host.
+        hashed = [canonicalize_with_hash(url) for url in urls]
+        if self.shards:
+            own_urls = set(self.shards.route([url for url, _ in hashed]))
+            hashed = [
+                (url, urlhash) for url, urlhash in hashed if url in own_urls]
+        new_urls = list()
+        self.seen_loaded.wait()
+        # The stage timers include the wait for the lock.
+        with metrics.timer("crawler_stage_seconds", stage="frontier_add"), \
+                self.lock:
+            for url, urlhash in hashed:
+                if not self.seen.add(urlhash):
+                    continue
+                if self.robots and not self.robots.allowed(
+                        url, urlparse(url).netloc):
+                    continue
+                # Rejected urls stay in seen, so they are not judged
+                # again, but are not saved.
+                if self.traps and not self.traps.admit(url):
+                    continue
+                self.save[urlhash] = (url, False)
+                self._enqueue(url)
+                new_urls.append(url)
+            if not new_urls:
+                return
+            with metrics.timer("crawler_stage_seconds", stage="store_commit"):
+                self.save.commit()
+            self.pending.add(new_urls)
+            with open(self.config.extracted_links, "a") as file:
+                file.write("\n".join(new_urls) + "\n")
+
+    def record_visit(self, url, resp):
+        ''' Keeps the validators and content hash of the page of url to
+        save them when it is marked complete. Returns False if the page
+        did not change since the last visit. '''
+        raw_response = resp.raw_response
+        content = resp.content
+        if raw_response is None or content is None:
+            return True
+        urlhash = get_urlhash(url)
+        with self.lock:
+            previous = self.revisits.get(urlhash)
+            if previous is None and urlhash in self.save:
+                # Urls queued again before a resume keep it in the save
+                # file.
+                previous = (self.save[urlhash][2:] or (None,))[0]
+        visit, changed = self.recrawl.visit(
+            previous, raw_response.headers, content)
+        with self.lock:
+            self.visits[urlhash] = visit
+        return changed
+
+    def retry_url(self, url):
+        ''' Queues url again, behind the other urls of its host, after its
+        download failed. Returns False if it has no retries left or the
+        retry budget is spent, and it is to be marked complete instead. '''
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-            with open("extracted_links.txt", "a") as file:
-                file.write(url + "\n")
-            file.close()
-    
+        with self.lock:
+            retries = self.retries.get(urlhash, 0)
+            if (retries >= self.config.max_retries
+                    or not self.throttle.spend_retry()):
+                return False
+            self.retries[urlhash] = retries + 1
+            self.visits.pop(urlhash, None)
+            self.in_flight.discard(url)
+            host = urlparse(url).netloc
+            if host not in self.host_queues:
+                self.host_queues[host] = deque()
+            self.host_queues[host].append(url)
+            # Scheduled after the backoff of the host.
+            self._release_host(host)
+            return True
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with metrics.timer("crawler_stage_seconds", stage="frontier_mark"), \
+                self.lock:
+            if self.seen_loaded.is_set() and urlhash not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            # A url that failed to download keeps its last Visit.
+            visit = self.visits.pop(urlhash, None)
+            previous = self.revisits.pop(urlhash, None)
+            self.retries.pop(urlhash, None)
+            self.save[urlhash] = (url, True, visit or previous)
+            with metrics.timer("crawler_stage_seconds", stage="store_commit"):
+                self.save.commit()
+            self.pending.complete(urlhash)
+            self.in_flight.discard(url)
+            self._release_host(urlparse(url).netloc)
+
+    def close(self):
+        if self.loader:
+            self.loader.join()
+        if self.robots:
+            self.robots.close()
+        if self.shards:
+            self.shards.close()
+        with self.lock:
+            # Leave the index with only the queued urls and the ones still
+            # downloading, and the seen urls and trap counters for the next
+            # resume.
+            self.pending.rewrite(list(self.in_flight) + [
+                url for queue in self.host_queues.values() for url in queue])
+            self.pending.close()
+            self.seen.dump(self.seen_path)
+            if self.traps:
+                self.traps.dump(self.traps_path)
+            self.save.close()
+            if self.dedup:
+                self.dedup.close()
+            if self.traps:
+                self.traps.close()
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+    def _release_host(self, host):
+        # The host may be downloaded from again once the politeness delay
+        # has passed since this download finished.
+        if host not in self.busy_hosts:
+            return
+        self.busy_hosts.discard(host)
+        self.host_ready_time[host] = time.time() + self._delay(host)
+        self._schedule_host(host)
+        self.lock.notify_all()
@@ -0,0 +1,195 @@
+import os
+import time
+from urllib.parse import urlparse
+
+from crawler.link_graph import RECORD
+from crawler.report import write_atomic
+from utils import get_logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Edges read from the memory mapped edge file at a time.
+CHUNK = 1 << 22
+
+
+class LinkAnalysis(object):
+    ''' In-degree, PageRank and subdomain connectivity of the link graph
+    recorded in config.link_graph by crawler/link_graph.py, written to
+    config.link_report. The PageRank of every url is also saved next to
+    the edge file, for the frontier to put the best ranked urls first
+    when the crawl resumes.
+
+    The edge file is memory mapped and read CHUNK edges at a time. Every
+    url id is replaced by its index in the sorted array of ids, and
+    pages recorded twice (recrawls) are counted once. Memory holds 12
+    bytes per recorded edge while they are indexed, then two int32 per
+    distinct edge and a few arrays per url, so tens of millions of edges
+    fit on one machine. Nothing is turned into Python
+    objects but the urls of the report and the subdomain of each url. '''
+    def __init__(self, config):
+        if np is None:
+            raise ImportError("The link analysis needs numpy.")
+        self.logger = get_logger("LINKS")
+        self.path = config.link_graph
+        self.report_path = config.link_report
+        self.damping = config.pagerank_damping
+        self.iterations = config.pagerank_iterations
+
+    def start(self):
+        start = time.time()
+        ids, sources, targets = self.load_edges()
+        if not len(ids):
+            self.logger.info(f"No links in {self.path}.")
+            return
+        in_degree = np.bincount(targets, minlength=len(ids))
+        ranks = self.pagerank(len(ids), sources, targets)
+        np.savez(f"{self.path}.ranks.npz", ids=ids, scores=ranks)
+        urls = self.load_urls(ids)
+        lines = [
+            "URLS", str(len(ids)),
+            "LINKS", str(len(sources)),
+            "TOP 50 PAGERANK"]
+        lines.extend(
+            f"{urls.get(index, hex(ids[index]))}: {ranks[index]:.6g}"
+            for index in np.argsort(-ranks, kind="stable")[:50])
+        lines.append("TOP 50 IN-DEGREE")
+        lines.extend(
+            f"{urls.get(index, hex(ids[index]))}: {in_degree[index]}"
+            for index in np.argsort(-in_degree, kind="stable")[:50])
+        lines.extend(self.subdomain_lines(urls, len(ids), sources, targets))
+        write_atomic(self.report_path, "\n".join(lines) + "\n")
+        self.logger.info(
+            f"Analyzed {len(sources)} links between {len(ids)} urls in "
+            f"{time.time() - start:.1f} s, wrote {self.report_path}.")
+
+    def _edges(self):
+        size = os.path.getsize(self.path) // RECORD.size
+        if not size:
+            return np.empty(0, np.dtype([("src", "<u8"), ("dst", "<u8")]))
+        return np.memmap(
+            self.path, np.dtype([("src", "<u8"), ("dst", "<u8")]), "r",
+            shape=(size,))
+
+    def load_edges(self):
+        ''' Returns the sorted url ids, and the index in them of the page
+        and of the link of every distinct edge, self links left out. '''
+        edges = self._edges()
+        ids = np.empty(0, np.uint64)
+        for start in range(0, len(edges), CHUNK):
+            chunk = edges[start:start + CHUNK]
+            ids = np.union1d(
+                ids, np.concatenate((chunk["src"], chunk["dst"])))
+        sources = np.empty(len(edges), np.int64)
+        targets = np.empty(len(edges), np.int32)
+        for start in range(0, len(edges), CHUNK):
+            chunk = edges[start:start + CHUNK]
+            sources[start:start + CHUNK] = np.searchsorted(ids, chunk["src"])
+            targets[start:start + CHUNK] = np.searchsorted(ids, chunk["dst"])
+        # One key per edge, so the distinct edges are one np.unique away.
+        sources *= len(ids)
+        sources += targets
+        del targets
+        keys = np.unique(sources)
+        del sources
+        sources = (keys // len(ids)).astype(np.int32)
+        targets = (keys % len(ids)).astype(np.int32)
+        del keys
+        distinct = sources != targets
+        return ids, sources[distinct], targets[distinct]
+
+    def pagerank(self, count, sources, targets, tolerance=1e-9):
+        ''' PageRank of count urls by power iteration, the rank of pages
+        without links spread over all urls. '''
+        out_degree = np.bincount(sources, minlength=count)
+        dangling = out_degree == 0
+        inverse = np.zeros(count)
+        inverse[~dangling] = 1.0 / out_degree[~dangling]
+        ranks = np.full(count, 1.0 / count)
+        iteration = change = 0
+        for iteration in range(1, self.iterations + 1):
+            shares = ranks * inverse
+            new_ranks = np.zeros(count)
+            for start in range(0, len(sources), CHUNK):
+                new_ranks += np.bincount(
+                    targets[start:start + CHUNK],
+                    weights=shares[sources[start:start + CHUNK]],
+                    minlength=count)
+            new_ranks += ranks[dangling].sum() / count
+            new_ranks *= self.damping
+            new_ranks += (1 - self.damping) / count
+            change = np.abs(new_ranks - ranks).sum()
+            ranks = new_ranks
+            if change < tolerance:
+                break
+        self.logger.info(
+            f"PageRank took {iteration} iterations, last change "
+            f"{change:.3g}.")
+        return ranks
+
+    def load_urls(self, ids):
+        ''' Index in ids: url, for the urls named in path.nodes. '''
+        node_ids = list()
+        names = list()
+        with open(f"{self.path}.nodes") as file:
+            for line in file:
+                node_id, _, url = line.rstrip("\n").partition(" ")
+                # A line torn by a crash has no url.
+                if url:
+                    node_ids.append(int(node_id, 16))
+                    names.append(url)
+        node_ids = np.array(node_ids, np.uint64)
+        positions = np.searchsorted(ids, node_ids)
+        positions[positions == len(ids)] = 0
+        found = ids[positions] == node_ids
+        return {
+            index: name for index, name, named in zip(
+                positions.tolist(), names, found.tolist()) if named}
+
+    def subdomain_lines(self, urls, count, sources, targets):
+        # Links within and between subdomains, counted with one np.unique
+        # over (subdomain of page, subdomain of link) keys.
+        hosts = [urlparse(url).netloc for url in urls.values()]
+        names = sorted(set(hosts))
+        number = {name: index for index, name in enumerate(names)}
+        subdomains = np.full(count, -1, np.int64)
+        subdomains[np.fromiter(urls.keys(), np.int64, len(urls))] = (
+            np.fromiter(
+                (number[host] for host in hosts), np.int64, len(hosts)))
+        page_subdomains = subdomains[sources]
+        link_subdomains = subdomains[targets]
+        known = (page_subdomains >= 0) & (link_subdomains >= 0)
+        keys, links = np.unique(
+            page_subdomains[known] * len(names) + link_subdomains[known],
+            return_counts=True)
+        pairs_from, pairs_to = keys // len(names), keys % len(names)
+        internal = np.bincount(
+            pairs_from[pairs_from == pairs_to],
+            weights=links[pairs_from == pairs_to], minlength=len(names))
+        between = pairs_from != pairs_to
+        out_links = np.bincount(
+            pairs_from[between], weights=links[between],
+            minlength=len(names))
+        in_links = np.bincount(
+            pairs_to[between], weights=links[between], minlength=len(names))
+        linked = np.bincount(pairs_from[between], minlength=len(names))
+        lines = [
+            "SUBDOMAINS (urls, internal links, links out, links in, "
+            "subdomains linked to)"]
+        url_counts = np.bincount(
+            subdomains[subdomains >= 0], minlength=len(names))
+        lines.extend(
+            f"{name}: {url_counts[index]}, {int(internal[index])}, "
+            f"{int(out_links[index])}, {int(in_links[index])}, "
+            f"{linked[index]}"
+            for index, name in enumerate(names))
+        lines.append("TOP 50 LINKS BETWEEN SUBDOMAINS")
+        order = np.argsort(-links[between], kind="stable")[:50]
+        lines.extend(
+            f"{names[source]} -> {names[target]}: {link_count}"
+            for source, target, link_count in zip(
+                pairs_from[between][order], pairs_to[between][order],
+                links[between][order]))
+        return lines
@@ -0,0 +1,112 @@
+import os
+import struct
+from threading import Lock
+
+from crawler.seen import SeenSet
+from utils import get_logger, get_urlhash
+from utils.canonical import canonicalize_with_hash
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Each record of the edge file is the id of a page and the id of a link.
+RECORD = struct.Struct("<QQ")
+
+
+def url_id(urlhash):
+    ''' 64 bit id of a url, the first 8 bytes of its utils.get_urlhash,
+    like the digests of the seen set. '''
+    return int(urlhash[:16], 16)
+
+
+class LinkRecorder(object):
+    ''' Appends the links of every scraped page to path, one record of
+    two little endian uint64 (page id, link id) per link, so the edge file
+    can be memory mapped by numpy (see crawler/link_analysis.py).
+
+    The url of each id is appended once to path.nodes as "id url" lines,
+    the id in hex, and the ids named so far are kept in a SeenSet. Both
+    files are kept across a resume and removed on restart, with the
+    PageRank file of the last analysis. '''
+    def __init__(self, path, restart):
+        self.logger = get_logger("LINKS")
+        self.path = path
+        self.nodes_path = f"{path}.nodes"
+        self.lock = Lock()
+        if restart:
+            for file_path in (path, self.nodes_path, f"{path}.ranks.npz"):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+        self.named = SeenSet()
+        if os.path.exists(self.nodes_path):
+            with open(self.nodes_path) as file:
+                for line in file:
+                    self.named.add(line[:16])
+        if os.path.exists(path):
+            # Drop a record torn by a crash.
+            size = os.path.getsize(path)
+            if size % RECORD.size:
+                os.truncate(path, size - size % RECORD.size)
+            self.logger.info(
+                f"Found {size // RECORD.size} links and {len(self.named)} "
+                f"urls in {path}.")
+        self.file = open(path, "ab")
+        self.nodes_file = open(self.nodes_path, "a")
+
+    def record(self, url, links):
+        ''' Adds the links of the page of url. Both are canonical, as the
+        frontier and scraper keep them, and hashed like the frontier does,
+        so the hashes of the links come from its cache. '''
+        urls = [url] + list(links)
+        hashes = [canonicalize_with_hash(link)[1] for link in urls]
+        page_id = url_id(hashes[0])
+        records = b"".join(
+            RECORD.pack(page_id, url_id(urlhash)) for urlhash in hashes[1:])
+        with self.lock:
+            self.file.write(records)
+            names = [
+                f"{urlhash[:16]} {link}"
+                for link, urlhash in zip(urls, hashes)
+                if self.named.add(urlhash)]
+            if names:
+                self.nodes_file.write("\n".join(names) + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.nodes_file.close()
+
+
+class LinkRanks(object):
+    ''' The PageRank of every url of the link graph, as saved by the last
+    launch.py --analyze, for the frontier to download the best ranked
+    urls of a host first. Needs numpy. '''
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+
+    @classmethod
+    def load(cls, path):
+        ''' The ranks saved at path, None if numpy is not installed. '''
+        if np is None:
+            return None
+        with np.load(path) as data:
+            return cls(data["ids"], data["scores"])
+
+    def rank(self, urls):
+        ''' The scores of urls, 0 for the ones not in the graph. '''
+        ids = np.fromiter(
+            (url_id(get_urlhash(url)) for url in urls), np.uint64,
+            len(urls))
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions == len(self.ids)] = 0
+        found = self.ids[positions] == ids if len(self.ids) else False
+        return np.where(found, self.scores[positions], 0.0)
+
+    def sort(self, urls):
+        ''' urls from the best ranked to the worst, keeping the order of
+        urls with the same rank. '''
+        order = np.argsort(-self.rank(urls), kind="stable")
+        return [urls[index] for index in order]
@@ -0,0 +1,186 @@
+import os
+import sys
+import tracemalloc
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread, get_ident
+
+from utils import get_logger
+from utils.metrics import metrics
+import scraper
+
+
+class SamplingProfiler(object):
+    ''' Samples the stack of every other thread each interval seconds and
+    counts the stacks, so it covers all workers at a small, fixed cost.
+    write saves them in the collapsed format flame graph tools read. '''
+    def __init__(self, interval=0.01, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        own_ident = get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = list()
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class MetricsExporter(object):
+    ''' Writes utils.metrics.metrics to config.metrics_file every
+    config.metrics_interval seconds and when the crawl ends, as JSON if
+    the file name ends with .json and in the Prometheus text format if
+    not. With config.metrics_port they are also served on
+    http://127.0.0.1:port/metrics (and /metrics.json).
+
+    config.profiler turns on the sampling profiler ("sample") or
+    tracemalloc ("tracemalloc"), written to config.profile_file. '''
+    def __init__(self, config, frontier):
+        self.logger = get_logger("METRICS")
+        self.path = config.metrics_file
+        self.interval = config.metrics_interval
+        self.profile_path = config.profile_file
+        self._add_gauges(frontier)
+        self.stopped = Event()
+        self.thread = None
+        self.server = None
+        self.profiler = None
+        self.tracing = False
+        if config.profiler == "sample":
+            self.profiler = SamplingProfiler(config.profile_interval)
+            self.profiler.start()
+        elif config.profiler == "tracemalloc":
+            tracemalloc.start()
+            self.tracing = True
+        elif config.profiler not in ("", "off"):
+            raise ValueError(f"Unknown profiler {config.profiler}.")
+        if config.metrics_port:
+            self.server = ThreadingHTTPServer(
+                ("127.0.0.1", config.metrics_port), self._handler())
+            Thread(target=self.server.serve_forever, daemon=True).start()
+            self.logger.info(
+                f"Serving metrics on http://127.0.0.1:{config.metrics_port}"
+                f"/metrics.")
+        if self.path and self.interval > 0:
+            self.thread = Thread(target=self._export, daemon=True)
+            self.thread.start()
+
+    def _add_gauges(self, frontier):
+        # The frontier gauges need the state of crawler.frontier.Frontier,
+        # custom frontiers only get the others.
+        if all(hasattr(frontier, name)
+               for name in ("host_queues", "in_flight", "seen")):
+            self._add_frontier_gauges(frontier)
+        throttle = getattr(frontier, "throttle", None)
+        if throttle is not None:
+            metrics.gauge(
+                "crawler_download_slots", lambda: int(throttle.limit))
+            metrics.gauge(
+                "crawler_downloads_in_flight", lambda: throttle.in_flight)
+            metrics.gauge(
+                "crawler_backed_off_hosts",
+                lambda: len(throttle.host_failures))
+        metrics.gauge("crawler_unique_urls", lambda: len(scraper.unique_urls))
+        metrics.gauge(
+            "crawler_is_valid_cache_hits",
+            lambda: scraper.url_filter.is_valid.cache_info().hits)
+        metrics.gauge(
+            "crawler_is_valid_cache_misses",
+            lambda: scraper.url_filter.is_valid.cache_info().misses)
+
+    def _add_frontier_gauges(self, frontier):
+        metrics.gauge(
+            "crawler_frontier_queued_urls",
+            lambda: sum(len(queue) for queue in frontier.host_queues.values()))
+        metrics.gauge(
+            "crawler_frontier_queued_hosts", lambda: len(frontier.host_queues))
+        metrics.gauge(
+            "crawler_frontier_in_flight_urls", lambda: len(frontier.in_flight))
+        metrics.gauge("crawler_seen_urls", lambda: len(frontier.seen))
+
+    def _handler(self):
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path == "/metrics":
+                    body = metrics.to_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                elif handler.path == "/metrics.json":
+                    body = metrics.to_json().encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    handler.send_error(404)
+                    return
+                handler.send_response(200)
+                handler.send_header("Content-Type", content_type)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+        return MetricsHandler
+
+    def _export(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        if not self.path:
+            return
+        text = (
+            metrics.to_json() if self.path.endswith(".json") else
+            metrics.to_prometheus())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(text)
+        os.replace(tmp_path, self.path)
+        if self.tracing:
+            self._write_allocations()
+
+    def _write_allocations(self):
+        snapshot = tracemalloc.take_snapshot()
+        with open(self.profile_path, "w") as file:
+            for stat in snapshot.statistics("lineno")[:50]:
+                file.write(f"{stat}\n")
+
+    def finish(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.write()
+        if self.server:
+            self.server.shutdown()
+        if self.profiler:
+            self.profiler.stop()
+            self.profiler.write(self.profile_path)
+            self.logger.info(
+                f"Wrote {self.profiler.samples} profile samples to "
+                f"{self.profile_path}.")
+        if self.tracing:
+            self._write_allocations()
+            tracemalloc.stop()
@@ -0,0 +1,171 @@
+import os
+import struct
+import zlib
+
+import cbor
+
+from threading import Lock
+
+from utils import get_logger, get_urlhash
+from utils.response import Response
+from utils.simhash import hash64
+
+# Each index record is the url hash, the content hash, where the
+# compressed reply is (segment, offset, length), its crc32 and the length
+# of the url, followed by the url.
+INDEX_RECORD = struct.Struct("<QQIQIIH")
+
+
+def url_key(url):
+    return int(get_urlhash(url)[:16], 16)
+
+
+class PageStore(object):
+    ''' Local copy of the replies of the cache server, for replay.
+
+    Every reply is zlib compressed and appended to the current segment,
+    pages-NNNNN.seg, which is closed once it reaches segment_size bytes.
+    Replies are addressed by the hash of their content, so a reply that
+    is already stored is not written again. The index, pages.idx, maps the
+    hash of every url to its latest reply and is loaded on open, dropping
+    a torn record at its end. '''
+    def __init__(self, directory, segment_size=1 << 28):
+        self.logger = get_logger("PAGESTORE")
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_path = os.path.join(directory, "pages.idx")
+        # url hash: (url, content hash)
+        self.urls = dict()
+        # content hash: (segment, offset, length, crc)
+        self.blobs = dict()
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+        self.segment = max(
+            (location[0] for location in self.blobs.values()), default=0)
+        self.segment_file = open(self._segment_path(self.segment), "ab")
+        self.index = open(self.index_path, "ab")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"pages-{segment:05d}.seg")
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        good_offset = 0
+        with open(self.index_path, "rb") as file:
+            while True:
+                header = file.read(INDEX_RECORD.size)
+                if len(header) < INDEX_RECORD.size:
+                    break
+                (urlkey, content_key, segment, offset, length, crc,
+                 url_length) = INDEX_RECORD.unpack(header)
+                url = file.read(url_length)
+                if len(url) < url_length:
+                    break
+                self.urls[urlkey] = (url.decode("utf-8"), content_key)
+                self.blobs[content_key] = (segment, offset, length, crc)
+                good_offset = file.tell()
+            torn = file.seek(0, os.SEEK_END) != good_offset
+        if torn:
+            self.logger.warning(
+                f"Dropping torn record at the end of {self.index_path}.")
+            with open(self.index_path, "r+b") as file:
+                file.truncate(good_offset)
+        self.logger.info(
+            f"Loaded {len(self.urls)} pages and {len(self.blobs)} replies "
+            f"from {self.index_path}.")
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __contains__(self, url):
+        return url_key(url) in self.urls
+
+    def record(self, url, content):
+        ''' Stores content, the CBOR reply of the cache server for url. '''
+        urlkey = url_key(url)
+        content_key = hash64(content)
+        encoded_url = url.encode("utf-8")
+        # Compressing is the slow part, so it is done outside the lock
+        # unless the reply is stored already.
+        with self.lock:
+            stored = content_key in self.blobs
+        blob = None if stored else zlib.compress(content)
+        with self.lock:
+            if self.urls.get(urlkey, (None, None))[1] == content_key:
+                return
+            if content_key not in self.blobs:
+                if blob is None:
+                    blob = zlib.compress(content)
+                if self.segment_file.tell() >= self.segment_size:
+                    self.segment_file.close()
+                    self.segment += 1
+                    self.segment_file = open(
+                        self._segment_path(self.segment), "ab")
+                offset = self.segment_file.tell()
+                # The reply is written before the index record that points
+                # to it, so the index never points past a segment.
+                self.segment_file.write(blob)
+                self.segment_file.flush()
+                self.blobs[content_key] = (
+                    self.segment, offset, len(blob), zlib.crc32(blob))
+            segment, offset, length, crc = self.blobs[content_key]
+            self.index.write(INDEX_RECORD.pack(
+                urlkey, content_key, segment, offset, length, crc,
+                len(encoded_url)) + encoded_url)
+            self.index.flush()
+            self.urls[urlkey] = (url, content_key)
+
+    def _read(self, file, location):
+        segment, offset, length, crc = location
+        file.seek(offset)
+        blob = file.read(length)
+        if len(blob) < length or zlib.crc32(blob) != crc:
+            raise ValueError(
+                f"Corrupt reply in {self._segment_path(segment)} at "
+                f"{offset}.")
+        return Response(cbor.loads(zlib.decompress(blob)))
+
+    def get(self, url):
+        ''' The stored Response of url, or None if it has none. '''
+        with self.lock:
+            entry = self.urls.get(url_key(url))
+            if entry is None:
+                return None
+            self.segment_file.flush()
+            location = self.blobs[entry[1]]
+        with open(self._segment_path(location[0]), "rb") as file:
+            return self._read(file, location)
+
+    def responses(self):
+        ''' Yields (url, Response) for every stored url, in the order of
+        the segments so they are read from start to end. '''
+        with self.lock:
+            self.segment_file.flush()
+            entries = sorted(
+                (self.blobs[content_key], url)
+                for url, content_key in self.urls.values())
+        file = None
+        segment = None
+        try:
+            for location, url in entries:
+                if location[0] != segment:
+                    if file:
+                        file.close()
+                    segment = location[0]
+                    file = open(self._segment_path(segment), "rb")
+                try:
+                    resp = self._read(file, location)
+                except Exception:
+                    self.logger.exception(f"Failed to read the page of {url}.")
+                    continue
+                yield url, resp
+        finally:
+            if file:
+                file.close()
+
+    def close(self):
+        with self.lock:
+            self.segment_file.close()
+            self.index.close()
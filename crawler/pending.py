@@ -0,0 +1,99 @@
+import os
+
+from crawler.seen import SeenSet
+
+
+class PendingIndex(object):
+    ''' The urls of the save file that are not downloaded yet, kept next
+    to it so a resume reads only those instead of the whole save file.
+
+    New urls are appended to path.pending, one per line, and the hashes
+    of completed urls to path.done. A url is pending if it is in the first
+    file and not in the second. Closing rewrites path.pending with the
+    urls still queued and empties path.done, so after a clean stop the
+    index holds exactly the unfinished work.
+
+    path.pending is only created by the first add or rewrite, so a save
+    file from before the index, or one whose index was not fully written,
+    is never mistaken for an indexed one. '''
+    def __init__(self, path, restart):
+        self.pending_path = f"{path}.pending"
+        self.done_path = f"{path}.done"
+        if restart:
+            for file_path in (self.pending_path, self.done_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+        self.found = os.path.exists(self.pending_path)
+        # Only what was written before this run is read back by
+        # iter_pending, the urls appended meanwhile are queued already.
+        self.resume_size = (
+            os.path.getsize(self.pending_path) if self.found else 0)
+        self.pending_file = (
+            open(self.pending_path, "a") if self.found else None)
+        if self.resume_size:
+            # End a line torn by a crash, so it does not run into the
+            # next url.
+            with open(self.pending_path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    self.pending_file.write("\n")
+                    self.pending_file.flush()
+        self.done_file = open(self.done_path, "a")
+
+    def _load_done(self):
+        done = SeenSet(8, max(1, os.path.getsize(self.done_path) // 17))
+        with open(self.done_path) as file:
+            for line in file:
+                # A line torn by a crash is skipped, its url is pending.
+                if len(line) == 17:
+                    done.add(line[:16])
+        return done
+
+    def iter_pending(self, get_urlhash, chunk_size=10000):
+        ''' Yields lists of up to chunk_size pending urls, in the order they
+        were added. Only valid if found is True. '''
+        done = self._load_done()
+        chunk = list()
+        with open(self.pending_path, "rb") as file:
+            read = 0
+            for line in file:
+                read += len(line)
+                if read > self.resume_size:
+                    break
+                url = line.rstrip(b"\r\n").decode("utf-8", "replace")
+                # After a clean stop nothing is done, so nothing is hashed.
+                if url and (not done or get_urlhash(url) not in done):
+                    chunk.append(url)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = list()
+        if chunk:
+            yield chunk
+
+    def add(self, urls):
+        if self.pending_file is None:
+            self.pending_file = open(self.pending_path, "a")
+        self.pending_file.write("\n".join(urls) + "\n")
+        self.pending_file.flush()
+
+    def complete(self, urlhash):
+        self.done_file.write(urlhash[:16] + "\n")
+        self.done_file.flush()
+
+    def rewrite(self, urls):
+        ''' Replaces the index with urls, the ones still pending. '''
+        tmp_path = f"{self.pending_path}.tmp"
+        with open(tmp_path, "w") as file:
+            for url in urls:
+                file.write(url + "\n")
+        if self.pending_file is not None:
+            self.pending_file.close()
+        os.replace(tmp_path, self.pending_path)
+        self.pending_file = open(self.pending_path, "a")
+        self.done_file.truncate(0)
+        self.done_file.flush()
+
+    def close(self):
+        if self.pending_file is not None:
+            self.pending_file.close()
+        self.done_file.close()
@@ -0,0 +1,75 @@
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from threading import BoundedSemaphore, Thread
+
+from utils import get_logger
+import scraper
+
+
+def _init_parse_process(url_filter, parser_mode):
+    # Parse processes are spawned, so they start from the default rules
+    # and need the ones the crawler was configured with.
+    scraper.url_filter = url_filter
+    scraper.parser_mode = parser_mode
+
+
+class ParseStage(object):
+    ''' Runs scraper.scrape_page for downloaded pages in a pool of
+    processes, so parsing is not held back by the GIL of the fetch
+    workers.
+
+    Workers submit the url and its Response and go back to downloading.
+    When a page is parsed, callback(url, future) is called in the parent
+    process; the result is the links and the PageStats of that page, for
+    scraper.merge_page. Parsed pages are queued for one of processes
+    finishing threads, so the callbacks neither wait for each other nor
+    hold up the thread of the executor that feeds the processes. At most
+    queue_size pages wait for or are in parsing or finishing, after that
+    submit blocks. '''
+    def __init__(self, processes, queue_size):
+        self.logger = get_logger("PARSE")
+        self.executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_process,
+            initargs=(scraper.url_filter, scraper.parser_mode))
+        self.slots = BoundedSemaphore(queue_size)
+        self.parsed = Queue()
+        self.finishers = [
+            Thread(target=self._finish, daemon=True)
+            for _ in range(processes)]
+        for finisher in self.finishers:
+            finisher.start()
+
+    def submit(self, url, resp, callback):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(scraper.scrape_page, url, resp)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(
+            lambda future: self.parsed.put((url, future, callback)))
+
+    def _finish(self):
+        while True:
+            parsed = self.parsed.get()
+            if parsed is None:
+                return
+            url, future, callback = parsed
+            try:
+                callback(url, future)
+            except Exception:
+                self.logger.exception(f"Failed to finish {url}.")
+            finally:
+                self.slots.release()
+
+    def shutdown(self):
+        # The executor runs the done callbacks before it shuts down, so
+        # every parsed page is queued before the finishers are stopped.
+        self.executor.shutdown(wait=True)
+        for _ in self.finishers:
+            self.parsed.put(None)
+        for finisher in self.finishers:
+            finisher.join()
@@ -0,0 +1,63 @@
+import time
+
+from crawler.dedup import DuplicateIndex
+from crawler.page_store import PageStore
+from crawler.pipeline import ParseStage
+from crawler.report import Report
+from utils import get_logger
+import scraper
+
+
+class Replay(object):
+    ''' Runs scraper over the pages kept in config.page_store and writes
+    the report, without the cache server or politeness delays.
+
+    Pages are parsed in config.parse_processes processes if that is set,
+    like in a crawl, and the duplicate index and report start empty, so
+    changed scraper rules can be checked against a crawl in minutes. The
+    report goes to the paths set by config.set_replay. '''
+    def __init__(self, config):
+        self.logger = get_logger("REPLAY")
+        self.config = config
+        if config.url_filter is not None:
+            scraper.url_filter = config.url_filter
+        self.store = PageStore(config.page_store, config.page_segment_size)
+        self.dedup = (
+            DuplicateIndex(
+                f"{config.save_file}.replay.dedup", True,
+                config.dedup_distance)
+            if config.dedup else None)
+        scraper.dedup_index = self.dedup
+        self.report = Report(config, True)
+        self.parse_stage = (
+            ParseStage(config.parse_processes, config.parse_queue)
+            if config.parse_processes > 0 else None)
+
+    def start(self):
+        start = time.time()
+        count = 0
+        for url, resp in self.store.responses():
+            count += 1
+            if self.parse_stage is not None and resp.status == 200:
+                self.parse_stage.submit(url, resp, self._parsed)
+                continue
+            try:
+                scraper.scraper(url, resp)
+            except Exception:
+                self.logger.exception(f"Failed to scrape {url}.")
+        if self.parse_stage:
+            self.parse_stage.shutdown()
+        self.report.finish()
+        if self.dedup:
+            self.dedup.close()
+        self.store.close()
+        elapsed = time.time() - start
+        self.logger.info(
+            f"Replayed {count} pages in {elapsed:.1f} s, "
+            f"{count / max(elapsed, 1e-9):.0f} pages/s.")
+
+    def _parsed(self, url, future):
+        try:
+            scraper.merge_page(url, *future.result())
+        except Exception:
+            self.logger.exception(f"Failed to scrape {url}.")
@@ -0,0 +1,138 @@
+import os
+from hashlib import sha256
+from threading import Event, RLock, Thread
+
+from crawler.seen import SeenSet
+from utils import get_logger
+import scraper
+
+
+class UniqueUrlLog(object):
+    ''' Stands in for the unique_urls set of the crawl statistics.
+
+    Every new url is appended to path as soon as it is merged, and only
+    a compact hash of it is kept in memory to skip it the next time. The
+    file is read back on resume and cleared on restart.
+
+    With owns, only the urls it returns True for are kept, so the shards
+    of a sharded crawl each count the urls of their own hosts. '''
+    def __init__(self, path, restart, owns=None):
+        self.path = path
+        self.owns = owns
+        self.seen = SeenSet()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    self.seen.add(self._hash(line.rstrip("\n")))
+        self.file = open(path, "a")
+
+    @staticmethod
+    def _hash(url):
+        return sha256(url.encode("utf-8")).hexdigest()
+
+    def __contains__(self, url):
+        return self._hash(url) in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def __iter__(self):
+        self.file.flush()
+        with open(self.path) as file:
+            for line in file:
+                yield line.rstrip("\n")
+
+    def add(self, url):
+        self.update([url])
+
+    def update(self, urls):
+        if self.owns is not None:
+            urls = [url for url in urls if self.owns(url)]
+        new_urls = [url for url in urls if self.seen.add(self._hash(url))]
+        if new_urls:
+            self.file.write("\n".join(new_urls) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def render_report(unique_count, longest_page, top_words, subdomains):
+    ''' The text of the crawl report, subdomains sorted by name. '''
+    lines = [
+        "UNIQUE URLS", str(unique_count),
+        "LONGEST PAGE", str(longest_page),
+        "TOP 50 WORDS"]
+    lines.extend(f"{word}: {count}" for word, count in top_words)
+    lines.append("SUBDOMAINS")
+    lines.extend(f"{subdomain}: {count}" for subdomain, count in subdomains)
+    return "\n".join(lines) + "\n"
+
+
+def write_atomic(path, text):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+class Report(object):
+    ''' Writes the crawl report from the merged statistics of scraper.
+
+    Unique urls are streamed to config.unique_urls_file while crawling
+    and the report only holds their count, and the top 50 words are kept
+    up to date while merging, so writing the report costs the same at
+    the end of any crawl. The report is replaced atomically: every
+    config.report_interval seconds with a snapshot if that is set, and
+    exactly once at the end by finish. owns is passed to UniqueUrlLog. '''
+    def __init__(self, config, restart, owns=None):
+        self.logger = get_logger("REPORT")
+        self.path = config.report_file
+        self.unique_urls = UniqueUrlLog(
+            config.unique_urls_file, restart, owns)
+        with scraper.stats_lock:
+            self.unique_urls.update(scraper.stats.unique_urls)
+            scraper.stats.unique_urls = self.unique_urls
+            scraper.unique_urls = self.unique_urls
+        self.interval = config.report_interval
+        self.lock = RLock()
+        self.finished = False
+        self.stopped = Event()
+        self.snapshot_thread = None
+        if self.interval > 0:
+            self.snapshot_thread = Thread(target=self._snapshots, daemon=True)
+            self.snapshot_thread.start()
+
+    def _snapshots(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def render(self):
+        with scraper.stats_lock:
+            unique_count = len(scraper.unique_urls)
+            longest_page = dict(scraper.longest_page)
+            subdomains = sorted(scraper.subdomain_dict.items())
+        return render_report(
+            unique_count, longest_page, scraper.get_top_50_words(),
+            subdomains)
+
+    def write(self):
+        with self.lock:
+            if self.finished:
+                return
+            write_atomic(self.path, self.render())
+
+    def finish(self):
+        ''' Writes the final report, only the first call does anything. '''
+        self.stopped.set()
+        if self.snapshot_thread:
+            self.snapshot_thread.join()
+        with self.lock:
+            if self.finished:
+                return
+            self.write()
+            self.finished = True
+            self.unique_urls.close()
+        self.logger.info(f"Wrote the crawl report to {self.path}.")
@@ -0,0 +1,113 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from utils import get_logger
+from utils.download import download
+from utils.robots import RobotsRules, parse_sitemap
+
+# Seconds until a robots.txt that could not be downloaded is tried again.
+# Until then the host is crawled as if it had none.
+ERROR_TTL = 600
+
+
+class RobotsCache(object):
+    ''' robots.txt rules per host, downloaded through the cache server.
+    Neither robots.txt nor sitemaps are kept in the page store.
+
+    request starts downloading the robots.txt of a host in one of threads
+    background threads, and calls callback(host) once its rules are in
+    the cache, so the frontier can hold back that host meanwhile and keep
+    crawling the others. The caller makes sure a host is only requested
+    once at a time. Rules expire after ttl seconds. '''
+    def __init__(self, config, callback, ttl=86400, threads=2):
+        self.logger = get_logger("ROBOTS")
+        self.config = config
+        self.callback = callback
+        self.ttl = ttl
+        # host: (expiry time, RobotsRules)
+        self.rules = dict()
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(threads)
+
+    def get(self, host):
+        ''' The rules of host, or None if they are not cached or expired. '''
+        with self.lock:
+            entry = self.rules.get(host)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def allowed(self, url, host):
+        ''' False only if the cached rules of host disallow url. '''
+        rules = self.get(host)
+        return rules is None or rules.allowed(url)
+
+    def crawl_delay(self, host):
+        rules = self.get(host)
+        return rules.crawl_delay if rules else 0
+
+    def request(self, host, scheme="https"):
+        self.executor.submit(self._fetch_in_background, host, scheme)
+
+    def _fetch_in_background(self, host, scheme):
+        try:
+            self.fetch(host, scheme)
+        except Exception:
+            self.logger.exception(f"Failed to get the robots.txt of {host}.")
+            with self.lock:
+                self.rules[host] = (time.time() + ERROR_TTL, RobotsRules())
+        finally:
+            self.callback(host)
+
+    def fetch(self, host, scheme="https"):
+        ''' Downloads, caches and returns the rules of host. '''
+        url = f"{scheme}://{host}/robots.txt"
+        resp = download(url, self.config, self.logger, record=False)
+        ttl = self.ttl
+        if resp.status == 200 and resp.raw_response is not None:
+            rules = RobotsRules.parse(
+                resp.raw_response.content, self.config.user_agent)
+        else:
+            # A missing robots.txt allows everything, and so does one that
+            # failed for now, until it is tried again.
+            rules = RobotsRules()
+            if not 400 <= resp.status < 500:
+                ttl = min(ttl, ERROR_TTL)
+        self.logger.info(
+            f"Got {url}, status <{resp.status}>, {len(rules.rules)} rules, "
+            f"crawl delay {rules.crawl_delay}.")
+        with self.lock:
+            self.rules[host] = (time.time() + ttl, rules)
+        return rules
+
+    def sitemap_urls(self, host, scheme="https", limit=50000):
+        ''' Page urls of the sitemaps the robots.txt of host lists, nested
+        sitemap indexes included, up to limit urls. '''
+        rules = self.get(host) or self.fetch(host, scheme)
+        sitemaps = list(rules.sitemaps)
+        fetched = set()
+        urls = list()
+        while sitemaps and len(urls) < limit:
+            sitemap = sitemaps.pop(0)
+            if sitemap in fetched:
+                continue
+            fetched.add(sitemap)
+            time.sleep(self.config.time_delay)
+            resp = download(sitemap, self.config, self.logger, record=False)
+            if resp.status != 200 or resp.raw_response is None:
+                continue
+            try:
+                page_urls, nested = parse_sitemap(resp.raw_response.content)
+            except Exception:
+                self.logger.exception(f"Failed to parse sitemap {sitemap}.")
+                continue
+            urls.extend(page_urls[:limit - len(urls)])
+            sitemaps.extend(nested)
+        self.logger.info(
+            f"Found {len(urls)} urls in {len(fetched)} sitemaps of {host}.")
+        return urls
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,131 @@
+import os
+import pickle
+
+MAX_LOAD = 0.7
+
+
+class BloomFilter(object):
+    ''' Bit array with k probes derived from the digest by double hashing. '''
+    def __init__(self, capacity, hash_count=7, bits_per_item=10):
+        self.size = max(64, capacity * bits_per_item)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.hash_count = hash_count
+
+    def _probes(self, digest):
+        h1 = int.from_bytes(digest[:4], "little")
+        h2 = int.from_bytes(digest[4:8], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest):
+        for bit in self._probes(digest):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, digest):
+        for bit in self._probes(digest):
+            if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+
+class SeenSet(object):
+    ''' Set of url hashes that keeps only the first digest_size bytes of
+    each sha256 in an open addressing table backed by one bytearray.
+
+    Takes the hex hashes returned by utils.get_urlhash. An all zero slot
+    marks an empty slot, so a digest that is all zeros is stored with
+    its first byte set to one. '''
+    def __init__(self, digest_size=8, capacity=1 << 16, bloom_capacity=0):
+        self.digest_size = digest_size
+        self.empty = bytes(digest_size)
+        self.slots = 1
+        while self.slots * MAX_LOAD < capacity:
+            self.slots <<= 1
+        self.table = bytearray(self.slots * digest_size)
+        self.count = 0
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+
+    def _digest(self, urlhash):
+        digest = bytes.fromhex(urlhash[:2 * self.digest_size])
+        if digest == self.empty:
+            digest = b"\x01" + digest[1:]
+        return digest
+
+    def _find(self, digest):
+        # Returns the slot holding the digest, or the empty slot where it
+        # would be inserted, and whether it was found.
+        size = self.digest_size
+        mask = self.slots - 1
+        table = self.table
+        slot = int.from_bytes(digest[:8], "little") & mask
+        while True:
+            offset = slot * size
+            current = table[offset:offset + size]
+            if current == digest:
+                return offset, True
+            if current == self.empty:
+                return offset, False
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        old_table = self.table
+        size = self.digest_size
+        self.slots <<= 1
+        self.table = bytearray(self.slots * size)
+        for offset in range(0, len(old_table), size):
+            digest = bytes(old_table[offset:offset + size])
+            if digest != self.empty:
+                new_offset, _ = self._find(digest)
+                self.table[new_offset:new_offset + size] = digest
+
+    def __contains__(self, urlhash):
+        digest = self._digest(urlhash)
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        return self._find(digest)[1]
+
+    def __len__(self):
+        return self.count
+
+    def add(self, urlhash):
+        ''' Adds the hash, returns False if it was already in the set. '''
+        digest = self._digest(urlhash)
+        if self.bloom is not None:
+            if digest not in self.bloom:
+                self.bloom.add(digest)
+                self._insert(digest)
+                return True
+        offset, found = self._find(digest)
+        if found:
+            return False
+        self._insert(digest, offset)
+        return True
+
+    def _insert(self, digest, offset=None):
+        if (self.count + 1) > self.slots * MAX_LOAD:
+            self._grow()
+            offset = None
+        if offset is None:
+            offset, _ = self._find(digest)
+        self.table[offset:offset + self.digest_size] = digest
+        self.count += 1
+
+    def update(self, urlhashes):
+        for urlhash in urlhashes:
+            self.add(urlhash)
+
+    def dump(self, path):
+        ''' Writes the set to path, so a resume can load it instead of
+        hashing every key of the save file again. '''
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+    def nbytes(self):
+        return len(self.table) + (len(self.bloom.bits) if self.bloom else 0)
@@ -0,0 +1,261 @@
+from bisect import bisect
+from collections import Counter
+from functools import lru_cache
+from threading import Event, Lock
+from urllib.parse import urlparse
+from uuid import uuid4
+
+import cbor
+
+from spacetime import Node
+
+from crawler.report import render_report, write_atomic
+from crawler.seen import SeenSet
+from utils import get_logger
+from utils.metrics import metrics
+from utils.pcc_models import ShardState, UrlBatch
+from utils.simhash import hash64
+from utils.topk import TopK
+import scraper
+
+
+class HashRing(object):
+    ''' Consistent hashing of hosts to the shards 0 .. shard_count - 1.
+
+    Every shard has replicas points on a ring of 64 bit hashes, and a
+    host belongs to the shard of the first point at or after its hash, so
+    changing the number of shards only moves the hosts of about one
+    shard's share of the ring. '''
+    def __init__(self, shard_count, replicas=128):
+        points = sorted(
+            (hash64(f"shard-{shard}-{replica}".encode("utf-8")), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+        self.shard_of = lru_cache(maxsize=1 << 16)(self._shard_of)
+
+    def _shard_of(self, host):
+        index = bisect(self.hashes, hash64(host.encode("utf-8")))
+        return self.shards[index % len(self.shards)]
+
+
+def encode_stats():
+    ''' The crawl statistics of scraper, as ShardState.stats. '''
+    with scraper.stats_lock:
+        return cbor.dumps({
+            "unique_urls": len(scraper.unique_urls),
+            "longest_page": dict(scraper.longest_page),
+            "frequencies": dict(scraper.frequency_dict),
+            "subdomains": dict(scraper.subdomain_dict)})
+
+
+def merge_report(states):
+    ''' The report of the whole crawl from the stats of every shard. Each
+    url is counted by the shard of its host only, so the unique urls of
+    the shards add up. '''
+    unique_count = 0
+    longest_page = {"url": "", "word_count": 0}
+    frequencies = Counter()
+    subdomains = Counter()
+    for state in states:
+        stats = cbor.loads(state.stats)
+        unique_count += stats["unique_urls"]
+        if stats["longest_page"]["word_count"] > longest_page["word_count"]:
+            longest_page = stats["longest_page"]
+        frequencies.update(stats["frequencies"])
+        subdomains.update(stats["subdomains"])
+    top_words = TopK(50)
+    for word, count in frequencies.items():
+        top_words.offer(word, count)
+    return render_report(
+        unique_count, longest_page, top_words.items(),
+        sorted(subdomains.items()))
+
+
+class ShardExchange(object):
+    ''' Connects the frontier of one shard of a sharded crawl to the other
+    shards through the spacetime dataframe at config.shard_server.
+
+    Hosts are assigned to shards by HashRing. route keeps the urls of
+    this shard's hosts and buffers the others, which are sent every
+    config.shard_interval seconds as one UrlBatch per shard. A url found
+    on pages is only sent the first time, a hash of it is kept in a
+    SeenSet. Batches for this shard are deleted from the dataframe and
+    passed to receive.
+
+    Each shard also publishes a ShardState with whether it is idle and
+    how many urls it sent and received. The crawl is finished once every
+    shard is idle and all sent urls were received, in two rounds in a
+    row, so a batch that was in flight during one round is not missed.
+    The crawl statistics of the shard are published when it closes. '''
+    def __init__(self, config, receive, is_idle, on_finished):
+        self.logger = get_logger("SHARDS")
+        self.shard_id = config.shard_id
+        self.shard_count = config.shard_count
+        self.interval = config.shard_interval
+        self.ring = HashRing(config.shard_count)
+        self.receive = receive
+        self.is_idle = is_idle
+        self.on_finished = on_finished
+        # (shard, counted): urls waiting for the next round
+        self.outgoing = dict()
+        # hashes of the counted urls sent so far
+        self.sent_urls = SeenSet()
+        self.lock = Lock()
+        self.sent = 0
+        self.received = 0
+        self.last_round = None
+        self.finished = Event()
+        self.stopped = Event()
+        self.node = Node(
+            self._exchange, Types=[UrlBatch, ShardState],
+            dataframe=config.shard_server, threading=True)
+        self.node.daemon = True
+
+    def start(self):
+        ''' Starts the rounds, once the frontier has queued its urls so it
+        is not taken for idle before. '''
+        self.node.start_async()
+
+    def owns(self, url):
+        return self.ring.shard_of(urlparse(url).netloc) == self.shard_id
+
+    def route(self, urls, counted=True):
+        ''' Returns the urls of this shard, the others are sent to their
+        shards with the next round. Only counted urls, the ones found on
+        pages, are added to the unique urls of their shard. '''
+        own_urls = list()
+        with self.lock:
+            for url in urls:
+                shard = self.ring.shard_of(urlparse(url).netloc)
+                if shard == self.shard_id:
+                    own_urls.append(url)
+                elif not counted or self.sent_urls.add(
+                        f"{hash64(url.encode('utf-8')):016x}"):
+                    self.outgoing.setdefault(
+                        (shard, counted), list()).append(url)
+        return own_urls
+
+    def has_outgoing(self):
+        with self.lock:
+            return bool(self.outgoing)
+
+    def _exchange(self, dataframe):
+        state = dataframe.read_one(ShardState, self.shard_id)
+        if state is None:
+            state = ShardState(self.shard_id)
+            dataframe.add_one(ShardState, state)
+        else:
+            # A resumed shard keeps counting where it stopped, the other
+            # shards still count the urls it sent and received.
+            self.sent, self.received = state.sent, state.received
+            state.done = False
+            state.stats = b""
+        while True:
+            stopping = self.stopped.is_set()
+            try:
+                self._round(dataframe, state, stopping)
+            except Exception:
+                self.logger.exception("Failed to exchange urls.")
+            if stopping:
+                return
+            self.stopped.wait(self.interval)
+
+    def _round(self, dataframe, state, stopping):
+        with self.lock:
+            outgoing, self.outgoing = self.outgoing, dict()
+        for (shard, counted), urls in outgoing.items():
+            dataframe.add_one(UrlBatch, UrlBatch(
+                f"{self.shard_id}-{uuid4().hex}", shard,
+                "\n".join(urls).encode("utf-8"), counted))
+            self.sent += len(urls)
+            metrics.count("crawler_shard_urls_total", len(urls), kind="sent")
+        dataframe.commit()
+        dataframe.push()
+        dataframe.pull()
+        dataframe.checkout()
+
+        for batch in dataframe.read_all(UrlBatch):
+            if batch.shard != self.shard_id:
+                continue
+            urls = batch.urls.decode("utf-8").split("\n")
+            dataframe.delete_one(UrlBatch, batch)
+            self.received += len(urls)
+            metrics.count(
+                "crawler_shard_urls_total", len(urls), kind="received")
+            if batch.counted:
+                # The shard that found these urls did not count them,
+                # since their hosts are not its own.
+                with scraper.stats_lock:
+                    scraper.unique_urls.update(urls)
+            self.receive(urls)
+
+        state.idle = self.is_idle() and not self.has_outgoing()
+        state.sent = self.sent
+        state.received = self.received
+        if stopping:
+            state.stats = encode_stats()
+            state.done = True
+        dataframe.commit()
+        dataframe.push()
+        self._check_finished(dataframe.read_all(ShardState))
+
+    def _check_finished(self, states):
+        this_round = tuple(sorted(
+            (state.shard, state.idle, state.sent, state.received)
+            for state in states))
+        last_round, self.last_round = self.last_round, this_round
+        if self.finished.is_set() or this_round != last_round:
+            return
+        if (len(this_round) == self.shard_count
+                and all(idle for _, idle, _, _ in this_round)
+                and sum(sent for _, _, sent, _ in this_round)
+                == sum(received for _, _, _, received in this_round)):
+            self.logger.info(
+                f"All {self.shard_count} shards are done, "
+                f"sent {self.sent} and received {self.received} urls.")
+            self.finished.set()
+            self.on_finished()
+
+    def close(self):
+        ''' Runs a last round that publishes the crawl statistics. '''
+        self.stopped.set()
+        self.node.join()
+
+
+class ShardServer(object):
+    ''' Stand-in for the spacetime dataframe server of a sharded crawl,
+    run with launch.py --shard_server on config.shard_server's port.
+
+    The shards push their UrlBatch and ShardState objects to it. Once all
+    config.shard_count shards are done it writes the report of the whole
+    crawl to config.report_file. '''
+    def __init__(self, config):
+        self.logger = get_logger("SHARDSERVER")
+        self.config = config
+
+    def start(self):
+        node = Node(
+            self._serve, Types=[UrlBatch, ShardState],
+            server_port=self.config.shard_server[1], threading=True)
+        node.start()
+
+    def _serve(self, dataframe):
+        self.logger.info(
+            f"Waiting for {self.config.shard_count} shards on port "
+            f"{self.config.shard_server[1]}.")
+        while True:
+            try:
+                dataframe.checkout_await(self.config.shard_interval * 10)
+            except TimeoutError:
+                pass
+            states = [
+                state for state in dataframe.read_all(ShardState)
+                if state.done]
+            if len(states) >= self.config.shard_count:
+                break
+        write_atomic(self.config.report_file, merge_report(states))
+        self.logger.info(
+            f"Wrote the report of {len(states)} shards to "
+            f"{self.config.report_file}.")
@@ -0,0 +1,275 @@
+import os
+import pickle
+import shelve
+import shutil
+import struct
+import time
+import zlib
+
+from threading import Event, Lock, RLock, Thread
+
+from utils import get_logger
+
+# Each log record is its payload length and crc32, followed by the
+# pickled (key, value) pair.
+RECORD_HEADER = struct.Struct("<II")
+
+
+class ShelveStore(object):
+    ''' The original frontier save file: a shelve synced on every commit. '''
+    def __init__(self, path):
+        self.path = path
+        self.db = shelve.open(path)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path)
+
+    @staticmethod
+    def remove(path):
+        os.remove(path)
+
+    def __contains__(self, key):
+        return key in self.db
+
+    def __len__(self):
+        return len(self.db)
+
+    def __getitem__(self, key):
+        return self.db[key]
+
+    def __setitem__(self, key, value):
+        self.db[key] = value
+
+    def keys(self):
+        return self.db.keys()
+
+    def values(self):
+        return self.db.values()
+
+    def commit(self):
+        self.db.sync()
+
+    def sync(self):
+        self.db.sync()
+
+    def close(self):
+        self.db.close()
+
+
+class LogStore(object):
+    ''' Append-only write-ahead log with group commit.
+
+    Writes are buffered and appended to the log once flush_records
+    records are pending or flush_interval ms have passed since the last
+    flush, checked by commit and by a background thread, so the last
+    records do not wait for the next commit when the crawl is quiet.
+
+    Every compact_records logged records the background thread writes
+    the whole state to a snapshot. It copies the state and moves the log
+    to path.compacting under the lock, so writers only wait for the copy,
+    and pickles the copy outside of it. On open the snapshot is loaded
+    and path.compacting, if a crash left it, and the log are replayed on
+    top of it, dropping a torn record at the tail left by a crash. '''
+    def __init__(self, path, flush_records=500, flush_interval=1000,
+                 compact_records=100000):
+        self.logger = get_logger("STORE")
+        self.path = path
+        self.snapshot_path = f"{path}.snapshot"
+        self.compacting_path = f"{path}.compacting"
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval / 1000
+        self.compact_records = compact_records
+        self.data = dict()
+        self.pending = list()
+        self.logged_records = 0
+        self.last_flush = time.time()
+        self.lock = RLock()
+        # One compaction at a time, they share path.compacting.
+        self.compact_lock = Lock()
+        self._recover()
+        if os.path.exists(self.compacting_path):
+            # Finish the compaction the crash interrupted, nothing else
+            # runs yet.
+            self._write_snapshot(self.data)
+            os.remove(self.compacting_path)
+            open(self.path, "wb").close()
+            self.logged_records = 0
+        self.log = open(self.path, "ab")
+        self.compact_due = False
+        self.wake = Event()
+        self.stopped = Event()
+        self.background = Thread(target=self._background, daemon=True)
+        self.background.start()
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(path) or os.path.exists(f"{path}.snapshot")
+
+    @staticmethod
+    def remove(path):
+        for file_path in (path, f"{path}.snapshot", f"{path}.compacting"):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def _recover(self):
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as file:
+                self.data = pickle.load(file)
+        for path in (self.compacting_path, self.path):
+            if os.path.exists(path):
+                self._replay(path)
+
+    def _replay(self, path):
+        good_offset = 0
+        with open(path, "rb") as file:
+            while True:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                key, value = pickle.loads(payload)
+                self.data[key] = value
+                self.logged_records += 1
+                good_offset = file.tell()
+            torn = file.seek(0, os.SEEK_END) != good_offset
+        if torn:
+            self.logger.warning(f"Dropping torn record at the end of {path}.")
+            with open(path, "r+b") as file:
+                file.truncate(good_offset)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.pending.append((key, value))
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def commit(self):
+        ''' Flushes the pending records if the group is full or old enough. '''
+        with self.lock:
+            if (len(self.pending) >= self.flush_records
+                    or time.time() - self.last_flush >= self.flush_interval):
+                self.sync()
+
+    def _background(self):
+        # Flushes old records every flush_interval, and compacts when sync
+        # asks for it.
+        timeout = self.flush_interval if self.flush_interval > 0 else None
+        while True:
+            self.wake.wait(timeout)
+            self.wake.clear()
+            if self.stopped.is_set():
+                return
+            try:
+                if self.compact_due:
+                    self.compact()
+                else:
+                    self.commit()
+            except Exception:
+                self.logger.exception(f"Failed to flush {self.path}.")
+
+    def sync(self):
+        with self.lock:
+            if self.pending:
+                chunks = list()
+                for record in self.pending:
+                    payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+                    chunks.append(RECORD_HEADER.pack(
+                        len(payload), zlib.crc32(payload)))
+                    chunks.append(payload)
+                self.log.write(b"".join(chunks))
+                self.log.flush()
+                os.fsync(self.log.fileno())
+                self.logged_records += len(self.pending)
+                self.pending = list()
+            self.last_flush = time.time()
+            if (self.logged_records >= self.compact_records
+                    and not self.compact_due):
+                self.compact_due = True
+                self.wake.set()
+
+    def compact(self):
+        ''' Writes the whole state to the snapshot and empties the log. '''
+        with self.compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self.lock:
+            self.sync()
+            data = dict(self.data)
+            # The records logged until now are in data, the log starts
+            # over. A crash before the snapshot is replaced replays them
+            # from path.compacting.
+            self.log.close()
+            try:
+                if os.path.exists(self.compacting_path):
+                    # An earlier compaction failed, keep its records in
+                    # front of these. Replaying both copies is harmless.
+                    with open(self.path, "rb") as log, \
+                            open(self.compacting_path, "ab") as file:
+                        shutil.copyfileobj(log, file)
+                        file.flush()
+                        os.fsync(file.fileno())
+                    open(self.path, "wb").close()
+                else:
+                    os.replace(self.path, self.compacting_path)
+            finally:
+                self.log = open(self.path, "ab")
+            self.logged_records = 0
+            self.compact_due = False
+        self._write_snapshot(data)
+        # Replaying path.compacting over the new snapshot is harmless, so
+        # a crash before this remove loses nothing.
+        os.remove(self.compacting_path)
+
+    def _write_snapshot(self, data):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(data, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def close(self):
+        self.stopped.set()
+        self.wake.set()
+        self.background.join()
+        with self.lock:
+            self.sync()
+            self.log.close()
+
+
+STORES = {"shelve": ShelveStore, "log": LogStore}
+
+
+def get_store_class(config):
+    try:
+        return STORES[config.store]
+    except KeyError:
+        raise ValueError(f"Unknown frontier store {config.store}.")
+
+
+def open_store(config):
+    store_class = get_store_class(config)
+    if store_class is LogStore:
+        return LogStore(
+            config.save_file, config.flush_records, config.flush_interval,
+            config.compact_records)
+    return store_class(config.save_file)
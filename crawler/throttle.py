@@ -0,0 +1,128 @@
+import random
+import time
+
+from threading import Condition
+
+# Weight of the newest download in the moving average of latency.
+LATENCY_WEIGHT = 0.2
+# Doublings of the host backoff at most, plenty to reach backoff_max.
+BACKOFF_DOUBLINGS = 16
+
+
+def is_failure(status):
+    ''' True for downloads worth trying again later: errors and timeouts
+    (status "error") and 5xx replies. '''
+    return not isinstance(status, int) or 500 <= status < 600
+
+
+class Throttle(object):
+    ''' Fits the crawl to what the cache server and the hosts can take.
+
+    Concurrency: workers acquire a slot for every download. The number of
+    slots starts at the number of workers (add_slots) and is adjusted
+    AIMD style when adaptive: one more slot per limit successful
+    downloads, and half of them after a failed download or one slower
+    than latency_target seconds, at most once per average download time
+    so one burst of failures only halves it once.
+
+    Backoff: after n downloads in a row from a host failed or were
+    slower than latency_target, an exponential backoff of up to
+    backoff_max seconds is added to its politeness delay, with jitter so
+    the hosts that failed together are not tried again together.
+
+    Retries: failed urls may be queued again as long as retries make up
+    at most retry_ratio of the downloads, so a server that is down is not
+    flooded with retries. '''
+    def __init__(self, adaptive=True, latency_target=0, backoff_max=300,
+                 retry_ratio=0.1, min_limit=1):
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.backoff_max = backoff_max
+        self.retry_ratio = retry_ratio
+        self.min_limit = min_limit
+        self.max_limit = 0
+        self.limit = 0.0
+        self.in_flight = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        # One retry of credit to start with, ten at most.
+        self.retry_tokens = 1.0
+        self.host_failures = dict()
+        self.lock = Condition()
+
+    def add_slots(self, count):
+        ''' Adds the downloads a new worker runs at once to the limit. '''
+        with self.lock:
+            self.max_limit += count
+            self.limit += count
+            self.lock.notify_all()
+
+    def _has_slot(self):
+        return self.in_flight < max(self.min_limit, int(self.limit))
+
+    def acquire(self):
+        with self.lock:
+            while not self._has_slot():
+                self.lock.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        ''' Non blocking acquire: returns False if all slots are taken. '''
+        with self.lock:
+            if not self._has_slot():
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.lock.notify()
+
+    def record(self, host, seconds, status):
+        ''' Adds a download from host that took seconds and ended with
+        status, the status of the Response or "error". '''
+        failed = is_failure(status)
+        now = time.monotonic()
+        with self.lock:
+            self.latency = (
+                seconds if self.latency is None else
+                self.latency + LATENCY_WEIGHT * (seconds - self.latency))
+            slow = self.latency_target and seconds > self.latency_target
+            if failed or slow:
+                self.host_failures[host] = self.host_failures.get(host, 0) + 1
+            else:
+                self.host_failures.pop(host, None)
+            if not failed:
+                self.retry_tokens = min(
+                    10.0, self.retry_tokens + self.retry_ratio)
+            if not self.adaptive:
+                return
+            if failed or slow:
+                if now - self.last_decrease > self.latency:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = now
+            elif self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.lock.notify_all()
+
+    def host_delay(self, host, politeness):
+        ''' Seconds to wait before the next download from host, at least
+        politeness. '''
+        with self.lock:
+            failures = self.host_failures.get(host)
+        if not failures:
+            return politeness
+        # A host that keeps failing would overflow the float otherwise.
+        backoff = min(
+            self.backoff_max,
+            max(politeness, 1) * 2 ** min(failures - 1, BACKOFF_DOUBLINGS))
+        return politeness + random.uniform(backoff / 2, backoff)
+
+    def spend_retry(self):
+        ''' Takes one retry from the budget, False if there is none left. '''
+        with self.lock:
+            if self.retry_tokens < 1:
+                return False
+            self.retry_tokens -= 1
+            return True
@@ -0,0 +1,162 @@
+import os
+import pickle
+import re
+from threading import Lock
+from urllib.parse import urlparse, parse_qsl
+
+from utils import get_logger
+from utils.simhash import hash64
+
+# path segments that only tell pages of the same kind apart: numbers, long
+# hex ids and uuids, and segments like dates or "page-12" with digits in them
+ID_SEGMENT = re.compile(
+    r"^(?:[0-9a-f]{12,}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}"
+    r"-[0-9a-f]{12})$", re.IGNORECASE)
+DIGITS = re.compile(r"\d+")
+
+
+def path_template(path):
+    ''' The path with every id segment replaced by "*" and every run of
+    digits by "0", so /events/2019-05-01/42 becomes /events/0-0-0/0. '''
+    segments = list()
+    for segment in path.split("/"):
+        if ID_SEGMENT.match(segment):
+            segments.append("*")
+        else:
+            segments.append(DIGITS.sub("0", segment))
+    return "/".join(segments)
+
+
+def query_signature(query):
+    ''' The sorted names of the query parameters, without their values. '''
+    return ",".join(sorted({name for name, _ in parse_qsl(
+        query, keep_blank_values=True)}))
+
+
+class TrapDetector(object):
+    ''' Cuts off url spaces that grow without end, like calendars, session
+    ids or wiki revisions.
+
+    Every new url is counted under its host, its path template and, if it
+    has a query, the path template with its query signature. A url is not
+    admitted when one of these passed its budget (0 means no budget). The
+    path templates and query signatures also keep a moving average of how
+    many of their crawled pages had new content: below min_yield only one
+    in throttle of their urls is admitted, and below a quarter of it none.
+
+    The counters are keyed by a 64 bit hash of the template, and are kept
+    across a resume with dump and load. Only the first decision about each
+    template is logged, and every rejected url is appended to path with
+    the reason, for review. '''
+    def __init__(self, path, restart, host_budget=0, template_budget=0,
+                 query_budget=0, min_yield=0, yield_window=50, throttle=10):
+        self.logger = get_logger("TRAPS")
+        self.budgets = {
+            "host": host_budget, "template": template_budget,
+            "query": query_budget}
+        self.min_yield = min_yield
+        self.yield_window = yield_window
+        self.throttle = throttle
+        # urls admitted per key
+        self.counts = dict()
+        # (pages crawled, moving average of pages with new content) per key
+        self.yields = dict()
+        # urls seen while the key is throttled, to admit one in throttle
+        self.skipped = dict()
+        # the last decision logged per key
+        self.decisions = dict()
+        self.rejected = 0
+        self.lock = Lock()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        self.file = open(path, "a")
+
+    def _keys(self, url):
+        parsed = urlparse(url)
+        template = f"{parsed.netloc}{path_template(parsed.path)}"
+        yield "host", parsed.netloc
+        yield "template", template
+        if parsed.query:
+            yield "query", f"{template}?{query_signature(parsed.query)}"
+
+    def count(self, url):
+        ''' Counts a url that was admitted before, when resuming a crawl. '''
+        with self.lock:
+            for _, key in self._keys(url):
+                key_hash = hash64(key.encode("utf-8"))
+                self.counts[key_hash] = self.counts.get(key_hash, 0) + 1
+
+    def admit(self, url):
+        ''' Returns True and counts the url if it may be crawled. '''
+        with self.lock:
+            keys = [
+                (kind, key, hash64(key.encode("utf-8")))
+                for kind, key in self._keys(url)]
+            for kind, key, key_hash in keys:
+                reason = self._check(kind, key_hash)
+                if reason is not None:
+                    self._reject(url, kind, key, key_hash, reason)
+                    return False
+            for _, _, key_hash in keys:
+                self.counts[key_hash] = self.counts.get(key_hash, 0) + 1
+            return True
+
+    def _check(self, kind, key_hash):
+        # The reason the url is rejected under this key, or None.
+        budget = self.budgets[kind]
+        count = self.counts.get(key_hash, 0)
+        if budget and count >= budget:
+            return f"cut off, {count} urls reached the budget of {budget}"
+        if kind == "host" or not self.min_yield:
+            return None
+        pages, average = self.yields.get(key_hash, (0, 1.0))
+        if pages < self.yield_window:
+            return None
+        if average < self.min_yield / 4:
+            return f"cut off, yield {average:.2f}"
+        if average < self.min_yield:
+            skipped = self.skipped.get(key_hash, 0) + 1
+            self.skipped[key_hash] = skipped
+            if skipped % self.throttle:
+                return f"throttled, yield {average:.2f}"
+        return None
+
+    def _reject(self, url, kind, key, key_hash, reason):
+        self.rejected += 1
+        self.file.write(f"{kind} {reason}\t{url}\n")
+        decision = reason.split(",")[0]
+        if self.decisions.get(key_hash) != decision:
+            self.decisions[key_hash] = decision
+            self.logger.info(f"{kind.capitalize()} {key} {reason}.")
+
+    def record_yield(self, url, new_content):
+        ''' Feeds back whether the crawled page of url had new content. '''
+        with self.lock:
+            for kind, key in self._keys(url):
+                if kind == "host":
+                    continue
+                key_hash = hash64(key.encode("utf-8"))
+                pages, average = self.yields.get(key_hash, (0, 1.0))
+                # The first pages count for more, so the average is known
+                # after yield_window pages.
+                weight = 1 / min(pages + 1, self.yield_window)
+                average += weight * (float(new_content) - average)
+                self.yields[key_hash] = (pages + 1, average)
+
+    def dump(self, path):
+        with self.lock:
+            with open(path, "wb") as file:
+                pickle.dump(
+                    (self.counts, self.yields), file, pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path):
+        with open(path, "rb") as file:
+            counts, yields = pickle.load(file)
+        with self.lock:
+            self.counts.update(counts)
+            self.yields.update(yields)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.logger.info(f"Rejected {self.rejected} trap urls.")
@@ -1,17 +1,37 @@
 from threading import Thread
 
 from inspect import getsource
+from urllib.parse import urlparse
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
+from crawler.throttle import is_failure
 import scraper
 import time
 
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, parse_stage=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
+        self.worker_id = worker_id
         self.config = config
         self.frontier = frontier
+        # crawler.pipeline.ParseStage that scrapes pages in other processes,
+        # or None to scrape them in this thread.
+        self.parse_stage = parse_stage
+        # Frontiers without record_visit never skip unchanged pages, and
+        # pages are only hashed for it when RECRAWL is on.
+        self.record_visit = (
+            getattr(frontier, "record_visit", None)
+            if config.recrawl else None)
+        # Frontiers without a throttle neither limit the downloads in
+        # flight nor retry failed ones.
+        self.throttle = getattr(frontier, "throttle", None)
+        self.retry_url = getattr(frontier, "retry_url", None)
+        # Frontiers without add_urls get the links of a page one by one.
+        self.add_urls = getattr(frontier, "add_urls", self._add_each)
+        if self.throttle is not None:
+            self.throttle.add_slots(self.concurrency)
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
@@ -21,32 +41,91 @@ class Worker(Thread):
         while True:
             tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
+                # The crawler writes the report once all workers stop.
                 self.logger.info("Frontier is empty. Stopping Crawler.")
-                with open("report.txt", "a") as file:
-                    file.write("UNIQUE URLS\n")
-                    file.write("\n".join(scraper.unique_urls) + "\n")  # Join set elements with newlines
+                break
+            if self.throttle is not None:
+                self.throttle.acquire()
+            start = time.perf_counter()
+            try:
+                resp = download(tbd_url, self.config, self.logger)
+            except Exception:
+                self.logger.exception(f"Failed to download {tbd_url}.")
+                self.record_download(tbd_url, "error", start)
+                self.download_failed(tbd_url)
+                continue
+            finally:
+                if self.throttle is not None:
+                    self.throttle.release()
+            self.record_download(tbd_url, resp.status, start)
+            if is_failure(resp.status):
+                self.download_failed(tbd_url)
+                continue
+            self.handle_response(tbd_url, resp)
 
-                    # Write longest page - ensure it's a string
-                    file.write("LONGEST PAGE\n")
-                    file.write(str(scraper.longest_page) + "\n")
+    @property
+    def concurrency(self):
+        ''' Downloads this worker runs at once. '''
+        return 1
 
-                    # Write top 50 words - ensure it's a string or join list items if it's a list
-                    file.write("TOP 50 WORDS\n")
-                    file.write("\n".join([f"{word}: {count}" for word, count in scraper.get_top_50_words()]) + "\n")
+    def _add_each(self, urls):
+        for url in urls:
+            self.frontier.add_url(url)
 
+    def download_failed(self, tbd_url):
+        # Queued again if it has retries left, and otherwise still marked
+        # complete, so its host is released and the crawl can finish.
+        if self.retry_url is not None and self.retry_url(tbd_url):
+            self.logger.info(f"Retrying {tbd_url} later.")
+            metrics.count("crawler_retries_total")
+            return
+        self.frontier.mark_url_complete(tbd_url)
 
-                    # Write subdomains - if it's a dictionary, convert it to a string with formatting
-                    file.write("SUBDOMAINS\n")
-                    for subdomain, count in sorted(scraper.subdomain_dict.items()):
-                        file.write(f"{subdomain}: {count}\n")
-                    file.close()
-                break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
-            scraped_urls = scraper.scraper(tbd_url, resp)
-            for scraped_url in scraped_urls:
-                self.frontier.add_url(scraped_url)
+    def record_download(self, tbd_url, status, start):
+        ''' Adds a download that began at time.perf_counter() start to the
+        latency histograms of this worker and of the host of tbd_url, and
+        to the throttle. '''
+        seconds = time.perf_counter() - start
+        host = urlparse(tbd_url).netloc
+        if self.throttle is not None:
+            self.throttle.record(host, seconds, status)
+        metrics.observe(
+            "crawler_download_seconds", seconds, worker=self.worker_id)
+        metrics.observe(
+            "crawler_host_download_seconds", seconds, host=host)
+        metrics.count(
+            "crawler_downloads_total", worker=self.worker_id,
+            status=str(status))
+
+    def handle_response(self, tbd_url, resp):
+        ''' Scrapes the page and marks the url complete, later from the
+        parse stage if there is one. The politeness delay is enforced per
+        host by the frontier. '''
+        self.logger.info(
+            f"Downloaded {tbd_url}, status <{resp.status}>, "
+            f"using cache {self.config.cache_server}.")
+        if (resp.status == 200 and self.record_visit is not None
+                and not self.record_visit(tbd_url, resp)):
+            # Unchanged since the last visit, so its links and statistics
+            # are already in the crawl.
+            self.logger.info(f"Skipping {tbd_url}, unchanged.")
+            metrics.count("crawler_unchanged_pages_total")
             self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+            return
+        if self.parse_stage is not None and resp.status == 200:
+            self.parse_stage.submit(tbd_url, resp, self.finish_parse)
+            return
+        try:
+            scraped_urls = scraper.scraper(tbd_url, resp)
+            self.add_urls(scraped_urls)
+        except Exception:
+            self.logger.exception(f"Failed to scrape {tbd_url}.")
+        self.frontier.mark_url_complete(tbd_url)
+
+    def finish_parse(self, tbd_url, future):
+        try:
+            scraped_urls = scraper.merge_page(tbd_url, *future.result())
+            self.add_urls(scraped_urls)
+        except Exception:
+            self.logger.exception(f"Failed to scrape {tbd_url}.")
+        self.frontier.mark_url_complete(tbd_url)
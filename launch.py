@@ -1,17 +1,52 @@
+import os
+
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
 from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.worker import Worker
+from crawler.async_worker import AsyncWorker
+from crawler.replay import Replay
+from crawler.shards import ShardServer
+from crawler.link_analysis import LinkAnalysis
 
 
-def main(config_file, restart):
+def main(config_file, restart, async_mode, replay, shard, shard_server,
+         recrawl, analyze):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
+    if recrawl:
+        config.recrawl = True
+    if shard is not None:
+        config.set_shard(shard)
+    if replay:
+        # Scrape the pages kept in PAGESTORE, the cache server is not used.
+        if not config.page_store or not os.path.isdir(config.page_store):
+            raise SystemExit(
+                f"No pages to replay in PAGESTORE ({config.page_store!r}), "
+                f"set it to the directory a crawl kept its pages in.")
+        config.set_replay()
+        Replay(config).start()
+        return
+    if analyze:
+        # In-degree, PageRank and subdomain links of LINKGRAPH.
+        if not config.link_graph or not os.path.isfile(config.link_graph):
+            raise SystemExit(
+                f"No links to analyze in LINKGRAPH ({config.link_graph!r}), "
+                f"set it to the file a crawl recorded its links in.")
+        LinkAnalysis(config).start()
+        return
+    if shard_server:
+        # Exchanges the urls of the shards of a sharded crawl and writes
+        # its report once they are all done.
+        ShardServer(config).start()
+        return
     config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
+    worker_factory = AsyncWorker if async_mode else Worker
+    crawler = Crawler(config, restart, worker_factory=worker_factory)
     crawler.start()
 
 
@@ -19,5 +54,15 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument(
+        "--async", dest="async_mode", action="store_true", default=False)
+    parser.add_argument("--replay", action="store_true", default=False)
+    parser.add_argument("--shard", type=int, default=None)
+    parser.add_argument(
+        "--shard_server", action="store_true", default=False)
+    parser.add_argument("--recrawl", action="store_true", default=False)
+    parser.add_argument("--analyze", action="store_true", default=False)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(
+        args.config_file, args.restart, args.async_mode, args.replay,
+        args.shard, args.shard_server, args.recrawl, args.analyze)
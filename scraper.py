@@ -1,22 +1,90 @@
 import re
 from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
-from collections import defaultdict
-
-# dictionary containing the frequency of all the tokens
-frequency_dict = defaultdict(int)
-
-# dictionary containing the frequency of all the subdomains
-subdomain_dict = defaultdict(int)
-
-# contains the name and word count of the url with the longest page
-longest_page = {"url": "", "word_count": 0}
-
-# contains a list of all of the unique urls
-unique_urls = set()
-
-# list of all the stop words that should not be added to the frequency dictionary
-stop_words = [
+from collections import Counter
+from threading import Lock
+from time import perf_counter
+from utils.canonical import canonicalize
+from utils.metrics import metrics
+from utils.page_parser import parse_page
+from utils.url_filter import UrlFilter
+from utils.simhash import content_hash, simhash
+from utils.topk import TopK
+
+# which parser extract_next_links uses: "auto" picks lxml if it is installed
+# and html.parser if not, "bs4" is the old BeautifulSoup way
+parser_mode = "auto"
+
+# the rules is_valid checks urls against, replaced by the crawler when
+# config.ini has a [FILTER] section
+url_filter = UrlFilter()
+
+# crawler.dedup.DuplicateIndex of the pages seen so far, set by the crawler,
+# pages that duplicate one of them are not counted or expanded
+dedup_index = None
+
+# crawler.traps.TrapDetector set by the crawler, told whether each crawled
+# page had new content so it can cut off url spaces that stop having any
+trap_detector = None
+
+# crawler.link_graph.LinkRecorder set by the crawler, the links of every
+# page are recorded in it for launch.py --analyze
+link_graph = None
+
+
+# the statistics of some pages, so pages can be scraped in other threads or
+# processes and merged into the crawl statistics afterwards
+class PageStats(object):
+    def __init__(self):
+        # dictionary containing the frequency of all the tokens
+        self.frequencies = Counter()
+        # dictionary containing the frequency of all the subdomains
+        self.subdomains = Counter()
+        # contains the name and word count of the url with the longest page
+        self.longest_page = {"url": "", "word_count": 0}
+        # contains a list of all of the unique urls
+        self.unique_urls = set()
+        # (content hash, simhash) of the page when these are the stats of
+        # one page, for the duplicate check before merging
+        self.fingerprint = None
+        # seconds spent in each stage of scrape_page, reported with the
+        # metrics of the crawler process when the page is merged
+        self.timings = dict()
+
+    def merge(self, other):
+        self.frequencies.update(other.frequencies)
+        self.subdomains.update(other.subdomains)
+        if other.longest_page["word_count"] > self.longest_page["word_count"]:
+            self.longest_page.update(other.longest_page)
+        self.unique_urls.update(other.unique_urls)
+
+
+# the statistics of the whole crawl, which also keep the 50 most common
+# words up to date so the report does not have to sort every word
+class CrawlStats(PageStats):
+    def __init__(self):
+        super().__init__()
+        self.top_words = TopK(50)
+
+    def merge(self, other):
+        super().merge(other)
+        for word in other.frequencies:
+            self.top_words.offer(word, self.frequencies[word])
+
+
+# statistics of the whole crawl, only changed through merge_stats
+stats = CrawlStats()
+stats_lock = Lock()
+
+# the names the report uses for the crawl statistics
+frequency_dict = stats.frequencies
+subdomain_dict = stats.subdomains
+longest_page = stats.longest_page
+# the crawler swaps this set for a crawler.report.UniqueUrlLog, which
+# writes the urls to disk instead of keeping them all in memory
+unique_urls = stats.unique_urls
+
+# set of all the stop words that should not be added to the frequency dictionary
+stop_words = frozenset([
     "a", "about", "above", "after", "again", "against", "all", "am", "an", "and", "any",
     "are", "aren't", "as", "at", "be", "because", "been", "before", "being", "below",
     "between", "both", "but", "by", "can't", "cannot", "could", "couldn't", "did", 
@@ -38,55 +106,135 @@ stop_words = [
     "you're", "you've", "your", "yours", "yourself", "yourselves", "s", "m", "d", "b",
     "t", "n", "e", "o", "r", "l", "u", "p", "j", "h", "k", "w", "f", "v", "z", "c", "y",
     "x", "g", "q", "1", "2", "3", "4", "5", "6", "7", "8", "9", "0"
+])
+
+# setting up check to see if the page is unresponsive
+error_messages = [
+    "this page isn't working",
+    "redirected you too many times",
+    "err_too_many_redirects",
+    "too many redirects", "under construction",
+    "don't have permission",
+    "server IP address could not be found",
+    "log in", "privileges are required",
+    "sign in", "can't be reached",
+    "access denied",
+    "restricted access", "required permissions",
+    "account required",
+    "you must be logged in",
+    "error", "no longer exists", "not found", "having trouble",
+    "not logged in", "version", "no events"
 ]
 
+# all the messages in one regex so the page text is only scanned once
+error_pattern = re.compile("|".join(re.escape(err) for err in error_messages))
+
+
+# a token is a run of ascii letters and digits in the lowercased text
+token_pattern = re.compile(r"[a-z0-9]+")
+
 
 # this is my tokenize function from project 1 that I tinkered a bit to better fit 
 # the purpose of this assignment. the content of the url page is passed into it
+# the regex does the whole text in one call instead of a loop over every char
 def tokenize(text_content: str) -> list:
-    tokens_list = []
-    word = ''
-    for char in text_content.lower():
-        if ('a' <= char <= 'z') or ('0' <= char <= '9'):
-            word += char
-        else:
-            if word:
-                tokens_list.append(word)
-                word = ''
-    if word: 
-        tokens_list.append(word)
-    return tokens_list
+    return token_pattern.findall(text_content.lower())
 
 
 # computes the word frequencies of the tokens picked from the url page
-# puts it in the frequency dictionary
-def computeWordFrequencies(tokens: list):
-    # adding token and their frequencies in dictionary
-    for token in tokens:
-        if token not in stop_words:
-            if token in frequency_dict:
-                frequency_dict[token] += 1
-            else:
-                frequency_dict[token] = 1
+# puts it in the given frequency dictionary
+def computeWordFrequencies(tokens: list, frequencies: Counter):
+    # count the page first, then drop the stop words it has and add the
+    # counts to the dictionary in one update
+    page_counts = Counter(tokens)
+    for token in stop_words.intersection(page_counts):
+        del page_counts[token]
+    frequencies.update(page_counts)
 
     
 
-# this function sorts the frequency dictionary from highest frequency to lowest frequency
-# it then only gets the top 50 most frequent words
+# gets the 50 most frequent words from highest frequency to lowest frequency
+# the top 50 is kept up to date while merging, so only those 50 get sorted
 def get_top_50_words():
-    # gets 50 most common words sorted by frequency
-    sorted_words = sorted(frequency_dict.items(), key=lambda item: (-item[1], item[0]))
-    return sorted_words[:50]
+    with stats_lock:
+        return stats.top_words.items()
+
+
+# adds the statistics of scraped pages to the crawl statistics. these are
+# the statistics of the pages scraped since the crawl (re)started, and a
+# recrawl only queues pages when it starts, so a page that changed since
+# its last visit is counted once, with its new content
+def merge_stats(page_stats: PageStats):
+    with stats_lock:
+        stats.merge(page_stats)
+
+
+# adds the time scrape_page spent on a page to the stage latency histograms
+def observe_timings(page_stats: PageStats):
+    for stage, seconds in page_stats.timings.items():
+        metrics.observe("crawler_stage_seconds", seconds, stage=stage)
+
+
+# true if the page is the same or almost the same as a page seen before
+def is_duplicate(url, page_stats: PageStats) -> bool:
+    if dedup_index is None or page_stats.fingerprint is None:
+        return False
+    return dedup_index.check_and_add(url, *page_stats.fingerprint)
+
 
+# records the links from the page of url to the link graph
+def record_links(url, links: list):
+    if link_graph is not None:
+        link_graph.record(url, links)
 
-# didnt change
+
+# tells the trap detector if the page added anything: it was kept by
+# scrape_page and is not a duplicate
+def record_yield(url, page_stats: PageStats, duplicate: bool):
+    if trap_detector is not None:
+        trap_detector.record_yield(
+            url, page_stats.fingerprint is not None and not duplicate)
+
+
+# second half of scraper for pages scraped with scrape_page somewhere else,
+# like the parse processes of crawler/pipeline.py
+def merge_page(url, links: list, page_stats: PageStats) -> list:
+    observe_timings(page_stats)
+    duplicate = is_duplicate(url, page_stats)
+    record_yield(url, page_stats, duplicate)
+    if duplicate:
+        return []
+    merge_stats(page_stats)
+    links = [link for link in links if is_valid(link)]
+    record_links(url, links)
+    return links
+
+
+# didnt change, but the links are recorded
 def scraper(url, resp):
     links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    links = [link for link in links if is_valid(link)]
+    record_links(url, links)
+    return links
 
 
 
 def extract_next_links(url, resp):
+    links, page_stats = scrape_page(url, resp)
+    observe_timings(page_stats)
+    # duplicate pages add nothing to the statistics and their links were
+    # already found on the first copy
+    duplicate = is_duplicate(url, page_stats)
+    record_yield(url, page_stats, duplicate)
+    if duplicate:
+        return []
+    merge_stats(page_stats)
+    return links
+
+
+# does the work of extract_next_links without touching the crawl statistics,
+# returns the links and the statistics of this page to merge later
+def scrape_page(url, resp):
     # Implementation required.
     # url: the URL that was used to get the page
     # resp.url: the actual url of the page
@@ -99,82 +247,72 @@ def extract_next_links(url, resp):
     
     # initialize list of hyprelinks
     hyper_set = set()
+    page_stats = PageStats()
 
-    # if status is not 200 return empty list
-    if resp.status != 200 or resp.raw_response is None or resp.error is not None:
-        return list(hyper_set)
-
-    # setting up check to see if the page is unresponsive
-    error_messages = [
-        "this page isn't working",
-        "redirected you too many times",
-        "err_too_many_redirects",
-        "too many redirects", "under construction",
-        "don't have permission",
-        "server IP address could not be found",
-        "log in", "privileges are required",
-        "sign in", "can't be reached",
-        "access denied",
-        "restricted access", "required permissions",
-        "account required",
-        "you must be logged in",
-        "error", "no longer exists", "not found", "having trouble",
-        "not logged in", "version", "no events"
-    ]
-
-    # Skip if error or login is required
-    content = resp.raw_response.content.decode('utf-8', errors='ignore') 
-    soup = BeautifulSoup(content, "html.parser")
-    text = soup.get_text(separator=' ')
-
+    # if status is not 200 return empty list, the page is only unpickled
+    # by resp.content when the status is fine
+    if resp.status != 200 or resp.error is not None:
+        return list(hyper_set), page_stats
+    content = resp.content
+    if content is None:
+        return list(hyper_set), page_stats
 
-    for err in error_messages:
-        if err in text.lower():
-            return list(hyper_set)
+    # get the text and the links of the page in one pass
+    start = perf_counter()
+    text, hrefs = parse_page(content, parser_mode)
+    page_stats.timings["parse"] = perf_counter() - start
 
-
-    # use beautiful soup to get content of the URL
-    content = resp.raw_response.content
-    soup = BeautifulSoup(content, "html.parser")
-    text = soup.get_text(separator=' ')
+    # Skip if error or login is required
+    if error_pattern.search(text.lower()):
+        return list(hyper_set), page_stats
 
     # tokenize the content in the URL
+    start = perf_counter()
     tokens = tokenize(text)
+    page_stats.timings["tokenize"] = perf_counter() - start
 
     # if the page doesn't have a lot of content just ignore it
     if len(tokens) < 50:
-        return list(hyper_set)
+        return list(hyper_set), page_stats
     
     # add them to the dictionary
-    computeWordFrequencies(tokens)
+    start = perf_counter()
+    computeWordFrequencies(tokens, page_stats.frequencies)
+    page_stats.timings["tokenize"] += perf_counter() - start
+
+    # fingerprint the page so duplicates can be skipped when merging
+    start = perf_counter()
+    page_stats.fingerprint = (
+        content_hash(content),
+        simhash(page_stats.frequencies))
+    page_stats.timings["fingerprint"] = perf_counter() - start
     
-    # check to see if its the longest page
-    if len(tokens) > longest_page["word_count"]:
-        longest_page.update({"url": url, "word_count": len(tokens)})
+    # this page is the longest page so far of its own statistics
+    page_stats.longest_page.update({"url": url, "word_count": len(tokens)})
 
     # gets the hyperlink
-    tags = soup.find_all('a', href=True)
-    for link in tags:
-        href = link.get('href')
+    valid_seconds = 0.0
+    for href in hrefs:
         full_url = urljoin(resp.raw_response.url, href)
 
-        # get rid of the fragments
-        parsed_url = urlparse(full_url)
-        unique_url = parsed_url._replace(fragment='').geturl()
+        # get rid of the fragments, and of everything else that makes
+        # one page look like several urls (see utils/canonical.py)
+        unique_url = canonicalize(full_url)
 
         # check again if the url is valid and also add to the list of subdomains
-        if is_valid(unique_url):
+        start = perf_counter()
+        valid = is_valid(unique_url)
+        valid_seconds += perf_counter() - start
+        if valid:
             hyper_set.add(unique_url)
-            unique_urls.add(unique_url)
-            domain = parsed_url.netloc
+            page_stats.unique_urls.add(unique_url)
+            domain = urlparse(unique_url).netloc
             if "uci.edu" in domain:
                 subdomain = domain if domain.endswith("uci.edu") else ""
                 if subdomain:
-                    if subdomain in subdomain_dict:
-                        subdomain_dict[subdomain] += 1
-                    else:
-                        subdomain_dict[subdomain] = 1
-    return list(hyper_set)  
+                    page_stats.subdomains[subdomain] += 1
+    page_stats.timings["is_valid"] = valid_seconds
+    return list(hyper_set), page_stats  
 
 
 
@@ -183,83 +321,6 @@ def extract_next_links(url, resp):
 def is_valid(url):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-
-    # valid domains
-    domains = [".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu", "today.uci.edu/department/information_computer_sciences"]
-    
-    # some things to filter out
-    unwanted_keywords = [
-    "do=", 
-    "action=", 
-    "date=",
-    "upload",
-    "download", 
-    "ical", 
-    "login", 
-    "password", 
-    "export", 
-    "attachment", 
-    "share=",
-    "format=",
-    "makefile", "calendar"
-    ] 
-
-    # dead url patterns
-    dead_url_patterns = [
-        r".*404.*",
-        r".*not-found.*",
-        r".*error.*",
-        r".*page-not-found.*",
-        r".*invalid.*"
-    ]
-
-    
-
-    try:
-        parsed = urlparse(url)
-
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        
-        if not any(parsed.netloc.endswith(domain) for domain in domains):
-            return False
-        
-        if any(keyword in parsed.path or keyword in parsed.query for keyword in unwanted_keywords):
-            return False
-        
-        if any(re.search(pattern, url) for pattern in dead_url_patterns):
-            return False
-        
-        unwanted_directory_pattern = r"./pdf/."
-
-        if re.search(unwanted_directory_pattern, url.lower()):
-            return False
-        
-        # added more things to check in regex and also made it check if any of these things were in the query or path
-        return (
-            not re.match(r".*\.(/pdf/|calendar|cart|view|edit|facebook.com|.json|ooad|format=|makefile|date=|share=|do=|action=|upload|download|ical|login|password|export|attachment)", parsed.query.lower()) and
-            not re.match(r".*\.(/pdf/|calendar|cart|view|edit|facebook.com|.json|ooad|format=|makefile|date=|share=|do=|action=|upload|download|ical|login|password|export|attachment)", parsed.path.lower()) and
-            not re.match(
-                r".*\.(css|js|bmp|gif|jpe?g|ico"
-                r"|png|tiff?|mid|mp2|mp3|mp4"
-                r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-                r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-                r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-                r"|epub|dll|cnf|tgz|sha1|cpp|h|cc|php|bw|cnt|bam|img"
-                r"|thmx|mso|arff|rtf|jar|csv|txt|defs|inc|odc|sas|ppsx|apk|asp|c|sql"
-                r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", 
-                parsed.query.lower()) and 
-            not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|img"
-            + r"|epub|dll|cnf|tgz|sha1|cpp|h|cc|defs|inc|odc|sas|ppsx|apk|asp|c|sql"
-            + r"|thmx|mso|arff|rtf|jar|csv|txt|php"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower()))
-
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
+    # The rules live in utils/url_filter.py and are compiled once, the
+    # [FILTER] section of config.ini can replace them.
+    return url_filter.is_valid(url)
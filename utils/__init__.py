@@ -1,13 +1,46 @@
 import os
+import atexit
 import logging
 from hashlib import sha256
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
 from urllib.parse import urlparse
 
+from utils.canonical import canonicalize
+
+# Loggers only put their records on this queue, and one listener thread
+# writes them to the file and stream handlers of each logger, so logging a
+# line never waits for the disk or the terminal.
+_log_queue = SimpleQueue()
+# logger name: the file and stream handlers of that logger
+_log_handlers = dict()
+_log_lock = Lock()
+_log_listener = None
+
+
+class _LogDispatcher(logging.Handler):
+    # Hands each record to the handlers of the logger it came from.
+    def handle(self, record):
+        for handler in _log_handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _start_log_listener():
+    global _log_listener
+    if _log_listener is None:
+        _log_listener = QueueListener(_log_queue, _LogDispatcher())
+        _log_listener.start()
+        # Write the records still queued before the process exits.
+        atexit.register(_log_listener.stop)
+
+
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
     if not os.path.exists("Logs"):
-        os.makedirs("Logs")
+        os.makedirs("Logs", exist_ok=True)
     fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
     fh.setLevel(logging.DEBUG)
     ch = logging.StreamHandler()
@@ -16,9 +49,13 @@ def get_logger(name, filename=None):
        "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
     fh.setFormatter(formatter)
     ch.setFormatter(formatter)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    # add the handlers to the listener, and the queue to the logger
+    with _log_lock:
+        _start_log_listener()
+        _log_handlers.setdefault(name, list()).extend((fh, ch))
+        if not any(isinstance(handler, QueueHandler)
+                   for handler in logger.handlers):
+            logger.addHandler(QueueHandler(_log_queue))
     return logger
 
 
@@ -30,6 +67,5 @@ def get_urlhash(url):
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    # See utils/canonical.py.
+    return canonicalize(url)
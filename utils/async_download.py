@@ -0,0 +1,145 @@
+import asyncio
+
+from urllib.parse import urlencode
+
+from utils.download import to_response, too_large
+
+
+class CacheResponse(object):
+    ''' The parts of a requests.Response that to_response looks at. '''
+    def __init__(self, status_code, reason, headers, content):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+
+    def __bool__(self):
+        return self.status_code < 400
+
+    def __repr__(self):
+        return f"<Response [{self.status_code}]>"
+
+
+class CacheConnectionPool(object):
+    ''' Keep-alive HTTP/1.1 connections to the cache server for asyncio.
+
+    At most size requests are in flight at once; idle connections are
+    reused by the next request instead of opening a new TCP connection.
+    A body over max_size bytes (0 for no limit) is not read, its content
+    is None and its connection is closed. '''
+    def __init__(self, host, port, size=100, max_size=0):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle = list()
+        self.slots = asyncio.Semaphore(size)
+
+    async def get(self, params):
+        async with self.slots:
+            while True:
+                reused = bool(self.idle)
+                reader, writer = (
+                    self.idle.pop() if reused else
+                    await asyncio.open_connection(self.host, self.port))
+                try:
+                    resp, keep_alive = await self._request(
+                        reader, writer, params)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        # The server closed the idle connection, retry
+                        # on a new one.
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if keep_alive:
+                    self.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return resp
+
+    async def _request(self, reader, writer, params):
+        writer.write(
+            f"GET /?{urlencode(params)} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Connection: keep-alive\r\n"
+            f"Accept-Encoding: identity\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Cache server closed the connection.")
+        version, status, *reason = status_line.decode("latin-1").split(" ", 2)
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (
+            headers.get("connection", "").lower() != "close"
+            and version != "HTTP/1.0")
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = list()
+            total = 0
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                total += size
+                if self.max_size and total > self.max_size:
+                    content = None
+                    keep_alive = False
+                    break
+                if not size:
+                    # Skip the trailers after the last chunk.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    content = b"".join(chunks)
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            length = int(headers["content-length"])
+            if self.max_size and length > self.max_size:
+                content = None
+                keep_alive = False
+            else:
+                content = await reader.readexactly(length)
+        else:
+            # The body ends when the server closes the connection. read
+            # returns what is buffered, so read until EOF.
+            chunks = list()
+            total = 0
+            while True:
+                chunk = await reader.read(1 << 16)
+                if not chunk:
+                    content = b"".join(chunks)
+                    break
+                total += len(chunk)
+                if self.max_size and total > self.max_size:
+                    content = None
+                    break
+                chunks.append(chunk)
+            keep_alive = False
+        reason = reason[0].strip() if reason else ""
+        return CacheResponse(int(status), reason, headers, content), keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = list()
+
+
+async def async_download(url, config, pool, logger=None):
+    ''' asyncio version of utils.download.download, sending the request
+    through a CacheConnectionPool to config.cache_server. Raises
+    asyncio.TimeoutError after config.download_timeout seconds. '''
+    resp = await asyncio.wait_for(
+        pool.get([("q", f"{url}"), ("u", f"{config.user_agent}")]),
+        config.download_timeout or None)
+    if resp.content is None:
+        return too_large(url, resp.status_code, pool.max_size, logger)
+    return to_response(url, resp, logger)
@@ -0,0 +1,112 @@
+import re
+from functools import lru_cache
+from hashlib import sha256
+from urllib.parse import urlsplit, urlunsplit, uses_params
+
+# query parameters that only track where a visitor came from or who they
+# are, dropped from every url (names are compared lowercased, and every
+# name starting with "utm_" is dropped too)
+TRACKING_PARAMS = frozenset([
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid",
+    "mc_eid", "_ga", "_gl", "phpsessid", "jsessionid", "sessionid"])
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+# percent escapes of the characters that never need one (RFC 3986
+# unreserved), and every escape to uppercase the hex digits of
+UNRESERVED = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+ESCAPE = re.compile(r"%[0-9a-fA-F]{2}")
+
+# canonical urls kept, most links of a page are on many other pages too
+CACHE_SIZE = 1 << 16
+
+
+def _unescape(match):
+    char = chr(int(match.group(0)[1:], 16))
+    return char if char in UNRESERVED else match.group(0).upper()
+
+
+def remove_dot_segments(path):
+    ''' The path with its "." and ".." segments resolved, as in RFC 3986
+    section 5.2.4: /a/./b/../c becomes /a/c. '''
+    if "." not in path:
+        return path
+    segments = list()
+    for segment in path.split("/"):
+        if segment == "..":
+            if segments and segments != [""]:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    if path.endswith(("/.", "/..")):
+        segments.append("")
+    return "/".join(segments)
+
+
+def _query(query):
+    # The query without tracking parameters and with the others sorted
+    # by name, keeping the order of the values of one name.
+    params = [
+        param for param in query.split("&")
+        if param and not _is_tracking(param.partition("=")[0])]
+    params.sort(key=lambda param: param.partition("=")[0])
+    return "&".join(params)
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith("utm_")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def canonicalize_with_hash(url):
+    ''' Returns the canonical form of url and its utils.get_urlhash,
+    both from one split of the url.
+
+    The scheme and host are lowercased, the default port and the
+    fragment are dropped, dot segments are resolved and trailing slashes
+    stripped from the path, escapes of unreserved characters are decoded
+    and tracking parameters are dropped from the query, whose other
+    parameters are sorted. Urls that differ only in these ways are one
+    page, so they are only downloaded once. '''
+    scheme, netloc, path, query, _ = urlsplit(url.strip())
+    if "%" in url:
+        path = ESCAPE.sub(_unescape, path)
+        query = ESCAPE.sub(_unescape, query)
+    scheme = scheme.lower()
+    if netloc:
+        userinfo, at, hostport = netloc.rpartition("@")
+        host, colon, port = hostport.partition(":")
+        if hostport.startswith("["):
+            # IPv6 literal, the port follows the closing bracket.
+            host, _, port = hostport.partition("]")
+            host += "]"
+            port = port[1:]
+        host = host.lower().rstrip(".")
+        if port and port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        netloc = f"{userinfo}{at}{host}"
+    path = remove_dot_segments(path).rstrip("/")
+    if query:
+        query = _query(query)
+    canonical = urlunsplit((scheme, netloc, path, query, ""))
+    return canonical, _urlhash(netloc, path, query, scheme)
+
+
+def _urlhash(netloc, path, query, scheme):
+    # Same hash as utils.get_urlhash, which splits the parameters of the
+    # last path segment from it for the schemes that have them.
+    params = ""
+    if scheme in uses_params and ";" in path:
+        slash = path.rfind("/")
+        semicolon = path.find(";", slash + 1)
+        if semicolon >= 0:
+            path, params = path[:semicolon], path[semicolon + 1:]
+    return sha256(
+        f"{netloc}/{path}/{params}/{query}/".encode("utf-8")).hexdigest()
+
+
+def canonicalize(url):
+    ''' The canonical form of url, see canonicalize_with_hash. '''
+    return canonicalize_with_hash(url)[0]
@@ -1,5 +1,7 @@
+import os
 import re
 
+from utils.url_filter import UrlFilter
 
 class Config(object):
     def __init__(self, config):
@@ -8,7 +10,74 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.async_tasks = config["LOCAL PROPERTIES"].getint(
+            "ASYNCTASKS", fallback=100)
+        self.parse_processes = config["LOCAL PROPERTIES"].getint(
+            "PARSEPROCESSES", fallback=0)
+        self.parse_queue = config["LOCAL PROPERTIES"].getint(
+            "PARSEQUEUE", fallback=64)
+        self.max_page_size = config["LOCAL PROPERTIES"].getint(
+            "MAXPAGESIZE", fallback=10485760)
+        self.download_timeout = config["LOCAL PROPERTIES"].getfloat(
+            "DOWNLOADTIMEOUT", fallback=60)
+        self.adaptive_concurrency = config["LOCAL PROPERTIES"].getboolean(
+            "ADAPTIVECONCURRENCY", fallback=True)
+        self.latency_target = config["LOCAL PROPERTIES"].getfloat(
+            "LATENCYTARGET", fallback=10)
+        self.backoff_max = config["LOCAL PROPERTIES"].getfloat(
+            "BACKOFFMAX", fallback=300)
+        self.max_retries = config["LOCAL PROPERTIES"].getint(
+            "MAXRETRIES", fallback=3)
+        self.retry_budget = config["LOCAL PROPERTIES"].getfloat(
+            "RETRYBUDGET", fallback=0.1)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.store = config["LOCAL PROPERTIES"].get("STORE", "shelve").strip()
+        self.flush_records = config["LOCAL PROPERTIES"].getint(
+            "FLUSHRECORDS", fallback=500)
+        self.flush_interval = config["LOCAL PROPERTIES"].getint(
+            "FLUSHINTERVAL", fallback=1000)
+        self.compact_records = config["LOCAL PROPERTIES"].getint(
+            "COMPACTRECORDS", fallback=100000)
+        self.dedup = config["LOCAL PROPERTIES"].getboolean(
+            "DEDUP", fallback=True)
+        self.dedup_distance = config["LOCAL PROPERTIES"].getint(
+            "DEDUPDISTANCE", fallback=3)
+        self.robots = config["LOCAL PROPERTIES"].getboolean(
+            "ROBOTS", fallback=True)
+        self.robots_ttl = config["LOCAL PROPERTIES"].getfloat(
+            "ROBOTSTTL", fallback=86400)
+        self.robots_threads = config["LOCAL PROPERTIES"].getint(
+            "ROBOTSTHREADS", fallback=2)
+        self.sitemap_urls = config["LOCAL PROPERTIES"].getint(
+            "SITEMAPURLS", fallback=50000)
+        self.traps = config["LOCAL PROPERTIES"].getboolean(
+            "TRAPS", fallback=True)
+        self.trap_log = config["LOCAL PROPERTIES"].get(
+            "TRAPLOG", "trap_urls.txt").strip()
+        self.trap_host_budget = config["LOCAL PROPERTIES"].getint(
+            "TRAPHOSTBUDGET", fallback=0)
+        self.trap_template_budget = config["LOCAL PROPERTIES"].getint(
+            "TRAPTEMPLATEBUDGET", fallback=2000)
+        self.trap_query_budget = config["LOCAL PROPERTIES"].getint(
+            "TRAPQUERYBUDGET", fallback=500)
+        self.trap_min_yield = config["LOCAL PROPERTIES"].getfloat(
+            "TRAPMINYIELD", fallback=0.2)
+        self.trap_window = config["LOCAL PROPERTIES"].getint(
+            "TRAPWINDOW", fallback=50)
+        self.trap_throttle = config["LOCAL PROPERTIES"].getint(
+            "TRAPTHROTTLE", fallback=10)
+        self.recrawl = config["LOCAL PROPERTIES"].getboolean(
+            "RECRAWL", fallback=False)
+        self.recrawl_interval = config["LOCAL PROPERTIES"].getfloat(
+            "RECRAWLINTERVAL", fallback=86400)
+        self.recrawl_min_interval = config["LOCAL PROPERTIES"].getfloat(
+            "RECRAWLMIN", fallback=3600)
+        self.recrawl_max_interval = config["LOCAL PROPERTIES"].getfloat(
+            "RECRAWLMAX", fallback=2592000)
+        self.seen_digest_size = config["LOCAL PROPERTIES"].getint(
+            "SEENDIGEST", fallback=8)
+        self.bloom_capacity = config["LOCAL PROPERTIES"].getint(
+            "BLOOMCAPACITY", fallback=0)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
@@ -16,4 +85,81 @@ class Config(object):
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
 
-        self.cache_server = None
\ No newline at end of file
+        # Optional [FILTER] section replacing the rules of scraper.is_valid.
+        self.url_filter = (
+            UrlFilter.from_config(config["FILTER"])
+            if config.has_section("FILTER") else None)
+
+        self.page_store = config["LOCAL PROPERTIES"].get(
+            "PAGESTORE", "").strip()
+        self.page_segment_size = config["LOCAL PROPERTIES"].getint(
+            "PAGESEGMENTSIZE", fallback=1 << 28)
+
+        self.link_graph = config["LOCAL PROPERTIES"].get(
+            "LINKGRAPH", "").strip()
+        self.link_report = config["LOCAL PROPERTIES"].get(
+            "LINKREPORT", "link_report.txt").strip()
+        self.link_priority = config["LOCAL PROPERTIES"].getboolean(
+            "LINKPRIORITY", fallback=True)
+        self.pagerank_damping = config["LOCAL PROPERTIES"].getfloat(
+            "PAGERANKDAMPING", fallback=0.85)
+        self.pagerank_iterations = config["LOCAL PROPERTIES"].getint(
+            "PAGERANKITERATIONS", fallback=50)
+
+        self.report_file = config["LOCAL PROPERTIES"].get(
+            "REPORT", "report.txt").strip()
+        self.unique_urls_file = config["LOCAL PROPERTIES"].get(
+            "UNIQUEURLS", "report_urls.txt").strip()
+        self.extracted_links = config["LOCAL PROPERTIES"].get(
+            "EXTRACTEDLINKS", "extracted_links.txt").strip()
+        self.report_interval = config["LOCAL PROPERTIES"].getfloat(
+            "REPORTINTERVAL", fallback=0)
+
+        self.metrics_file = config["LOCAL PROPERTIES"].get(
+            "METRICSFILE", "metrics.prom").strip()
+        self.metrics_interval = config["LOCAL PROPERTIES"].getfloat(
+            "METRICSINTERVAL", fallback=10)
+        self.metrics_port = config["LOCAL PROPERTIES"].getint(
+            "METRICSPORT", fallback=0)
+        self.profiler = config["LOCAL PROPERTIES"].get(
+            "PROFILER", "off").strip().lower()
+        self.profile_file = config["LOCAL PROPERTIES"].get(
+            "PROFILEFILE", "profile.txt").strip()
+        self.profile_interval = config["LOCAL PROPERTIES"].getfloat(
+            "PROFILEINTERVAL", fallback=0.01)
+
+        # Sharded crawl (see crawler/shards.py): this is shard SHARDID of
+        # SHARDS, exchanging urls through the dataframe at SHARDSERVER.
+        self.shard_count = config["LOCAL PROPERTIES"].getint(
+            "SHARDS", fallback=1)
+        self.shard_id = config["LOCAL PROPERTIES"].getint(
+            "SHARDID", fallback=0)
+        shard_host, _, shard_port = config["LOCAL PROPERTIES"].get(
+            "SHARDSERVER", "127.0.0.1:9100").strip().rpartition(":")
+        self.shard_server = (shard_host, int(shard_port))
+        self.shard_interval = config["LOCAL PROPERTIES"].getfloat(
+            "SHARDINTERVAL", fallback=1)
+
+        self.cache_server = None
+
+    def set_shard(self, shard_id):
+        ''' Makes this shard shard_id, with its own save, report, trap,
+        metrics, page and link files, so several shards can run from one
+        directory. '''
+        assert 0 <= shard_id < self.shard_count, "SHARDID out of range"
+        self.shard_id = shard_id
+        for name in (
+                "save_file", "report_file", "unique_urls_file", "trap_log",
+                "metrics_file", "profile_file", "page_store", "link_graph",
+                "link_report", "extracted_links"):
+            path = getattr(self, name)
+            if path:
+                root, ext = os.path.splitext(path)
+                setattr(self, name, f"{root}.shard{shard_id}{ext}")
+
+    def set_replay(self):
+        ''' Makes launch.py --replay write its own report and unique urls,
+        next to the ones of the crawl it replays. '''
+        for name in ("report_file", "unique_urls_file"):
+            root, ext = os.path.splitext(getattr(self, name))
+            setattr(self, name, f"{root}.replay{ext}")
@@ -2,19 +2,72 @@ import requests
 import cbor
 import time
 
+from threading import local
+
 from utils.response import Response
 
-def download(url, config, logger=None):
+# crawler.page_store.PageStore every reply of the cache server is recorded
+# in, set by the crawler when config.ini has PAGESTORE
+page_store = None
+
+# One requests.Session per thread, so each worker keeps its connection to
+# the cache server alive instead of opening a new one for every url.
+_sessions = local()
+
+def _get_session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+def download(url, config, logger=None, record=True):
     host, port = config.cache_server
-    resp = requests.get(
+    # The reply is streamed so a page over config.max_page_size is dropped
+    # without reading all of it. requests.Timeout is raised when the cache
+    # server does not answer for config.download_timeout seconds.
+    resp = _get_session().get(
         f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        stream=True, timeout=config.download_timeout or None)
+    max_size = config.max_page_size
+    if not max_size:
+        return to_response(url, resp, logger, record=record)
+    if int(resp.headers.get("content-length") or 0) > max_size:
+        resp.close()
+        return too_large(url, resp.status_code, max_size, logger)
+    chunks = list()
+    size = 0
+    for chunk in resp.iter_content(1 << 16):
+        size += len(chunk)
+        if size > max_size:
+            resp.close()
+            return too_large(url, resp.status_code, max_size, logger)
+        chunks.append(chunk)
+    return to_response(url, resp, logger, b"".join(chunks), record)
+
+def too_large(url, status, max_size, logger=None):
+    error = f"Page of {url} is larger than {max_size} bytes, skipped."
+    if logger:
+        logger.info(error)
+    return Response({"error": error, "status": status, "url": url})
+
+def to_response(url, resp, logger=None, content=None, record=True):
+    ''' Builds the Response from the reply of the cache server. Shared by
+    the blocking and the asyncio (utils/async_download.py) paths. content
+    is the body of resp if it was read already. The reply is kept in
+    page_store if there is one, unless record is False. '''
+    if content is None:
+        content = resp.content
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if resp and content:
+            response = Response(cbor.loads(content))
+            if record and page_store is not None:
+                page_store.record(url, content)
+            return response
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error {resp} with url {url}.")
     return Response({
         "error": f"Spacetime Response error {resp} with url {url}.",
         "status": resp.status_code,
@@ -0,0 +1,148 @@
+import json
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+# Upper bounds in seconds of the histogram buckets, the last one is +Inf.
+BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+
+def _key(name, labels):
+    # Label values are kept as str, so keys of one metric always sort.
+    return (name, tuple(sorted(
+        (label, str(value)) for label, value in labels.items())))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram(object):
+    ''' Count of observations per bucket of BUCKETS, and their sum. '''
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics(object):
+    ''' Counters, latency histograms and gauges of one process, labeled
+    like Prometheus metrics (worker, host, stage, ...).
+
+    Updates only take a lock and bump a number. Gauges are functions that
+    are called when the metrics are exported. '''
+    def __init__(self):
+        self.counters = dict()
+        self.histograms = dict()
+        self.gauges = dict()
+        self.lock = Lock()
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, function, **labels):
+        ''' Exports the value function() returns under name. '''
+        with self.lock:
+            self.gauges[_key(name, labels)] = function
+
+    def snapshot(self):
+        ''' Copies of the counters and histograms, and the gauge values. '''
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {
+                key: (list(histogram.counts), histogram.total,
+                      histogram.count)
+                for key, histogram in self.histograms.items()}
+            gauges = list(self.gauges.items())
+        values = dict()
+        for key, function in gauges:
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return counters, histograms, values
+
+    def to_json(self):
+        counters, histograms, gauges = self.snapshot()
+        def name(key):
+            return key[0] + _label_text(key[1])
+        return json.dumps({
+            "time": time.time(),
+            "counters": {name(key): value for key, value in counters.items()},
+            "gauges": {name(key): value for key, value in gauges.items()},
+            "histograms": {
+                name(key): {
+                    "count": count, "sum": total,
+                    "buckets": {
+                        str(bound): bucket
+                        for bound, bucket in zip(BUCKETS, counts)}}
+                for key, (counts, total, count) in histograms.items()},
+        }, indent=1, sort_keys=True)
+
+    def to_prometheus(self):
+        counters, histograms, gauges = self.snapshot()
+        lines = list()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            typed = set()
+            for (name, labels), value in sorted(values.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_label_text(labels)} {value}")
+        typed = set()
+        for (name, labels), (counts, total, count) in sorted(
+                histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(
+                    f"{name}_bucket{_label_text(labels, [('le', le)])} "
+                    f"{cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# the metrics of this process, updated from anywhere in the crawler
+metrics = Metrics()
@@ -0,0 +1,110 @@
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Tags whose contents are not visible text, same as BeautifulSoup.get_text.
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+class PageCollector(object):
+    ''' Collects the visible text and the <a href> values of a page.
+
+    Text inside one element is joined as it arrives, and separate text
+    nodes are joined with a space like get_text(separator=' '). '''
+    def __init__(self):
+        self.chunks = list()
+        self.buffer = list()
+        self.links = list()
+        self.skip_depth = 0
+
+    def start(self, tag, attrs):
+        self.flush()
+        tag = tag.lower()
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrs.get("href")
+            if href is not None:
+                self.links.append(href)
+
+    def end(self, tag):
+        self.flush()
+        if tag.lower() in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, text):
+        if not self.skip_depth:
+            self.buffer.append(text)
+
+    def flush(self):
+        if self.buffer:
+            self.chunks.append("".join(self.buffer))
+            self.buffer = list()
+
+    def close(self):
+        self.flush()
+        return " ".join(self.chunks), self.links
+
+
+class StreamingParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.collector = PageCollector()
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def unknown_decl(self, data):
+        if data.startswith("CDATA["):
+            self.collector.data(data[6:])
+
+
+def parse_stdlib(content):
+    parser = StreamingParser()
+    parser.feed(content)
+    parser.close()
+    return parser.collector.close()
+
+
+def parse_lxml(content):
+    parser = etree.HTMLParser(target=PageCollector())
+    parser.feed(content)
+    return parser.close()
+
+
+def parse_bs4(content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    text = soup.get_text(separator=' ')
+    links = [link.get('href') for link in soup.find_all('a', href=True)]
+    return text, links
+
+
+PARSERS = {"stdlib": parse_stdlib, "lxml": parse_lxml, "bs4": parse_bs4}
+
+
+def parse_page(content, mode="auto"):
+    ''' Returns the visible text and the list of href values of the page
+    in one pass over the content.
+
+    mode is lxml, stdlib or bs4; auto uses lxml when it is installed and
+    the standard library html.parser otherwise. bs4 is the original
+    BeautifulSoup implementation, kept as a fallback. '''
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = str(content, "utf-8", "ignore")
+    if mode == "auto":
+        mode = "lxml" if etree is not None else "stdlib"
+    return PARSERS[mode](content)
@@ -13,3 +13,40 @@ class Register(object):
         self.load_balancer = tuple()
         self.fresh = fresh
         self.invalid = False
+
+
+@pcc_set
+class UrlBatch(object):
+    ''' Urls found by one crawler shard whose hosts belong to another. '''
+    batch_id = primarykey(str)
+    shard = dimension(int)
+    urls = dimension(bytes)
+    counted = dimension(bool)
+
+    def __init__(self, batch_id, shard, urls, counted):
+        self.batch_id = batch_id
+        self.shard = shard
+        # the urls joined by newlines, utf-8 encoded
+        self.urls = urls
+        # whether they were found on pages and count as unique urls
+        self.counted = counted
+
+
+@pcc_set
+class ShardState(object):
+    ''' Progress of one crawler shard, for termination and the report. '''
+    shard = primarykey(int)
+    idle = dimension(bool)
+    sent = dimension(int)
+    received = dimension(int)
+    done = dimension(bool)
+    stats = dimension(bytes)
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.idle = False
+        self.sent = 0
+        self.received = 0
+        self.done = False
+        # cbor encoded crawl statistics of the shard, set when it is done
+        self.stats = b""
@@ -1,14 +1,50 @@
 import pickle
 
 class Response(object):
+    ''' A page from the cache server.
+
+    raw_response is only unpickled the first time it is used, so pages
+    that are skipped on their status never pay for it, and a Response sent
+    to a parse process carries the pickled bytes instead of the object.
+    The pickled bytes are dropped once unpickled, so a page is not held
+    twice in memory. content is the body of raw_response as a
+    memoryview, so slicing it does not copy the page. '''
+    __slots__ = ("url", "status", "error", "_pickled", "_raw_response")
+
     def __init__(self, resp_dict):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None and self._raw_response is None:
+            try:
+                self._raw_response = pickle.loads(self._pickled)
+            except TypeError:
+                pass
+            self._pickled = None
+        return self._raw_response
+
+    @property
+    def content(self):
+        ''' The body of the page, or None if there is none. '''
+        raw_response = self.raw_response
+        if raw_response is None or raw_response.content is None:
+            return None
+        return memoryview(raw_response.content)
+
+    def __getstate__(self):
+        # Send the pickled page if it was not unpickled yet, rather than
+        # unpickle it to pickle it again.
+        if self._pickled is not None:
+            return self.url, self.status, self.error, self._pickled, None
+        return (
+            self.url, self.status, self.error, self._pickled,
+            self._raw_response)
+
+    def __setstate__(self, state):
+        (self.url, self.status, self.error, self._pickled,
+         self._raw_response) = state
@@ -0,0 +1,111 @@
+import gzip
+import re
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+# Crawlers only have to read this much of a robots.txt.
+MAX_ROBOTS_SIZE = 500 * 1024
+
+
+def _rule_pattern(path):
+    # "*" matches anything and a "$" at the end anchors the rule at the end
+    # of the url, everything else is matched literally from the start.
+    anchored = path.endswith("$")
+    if anchored:
+        path = path[:-1]
+    pattern = ".*".join(re.escape(part) for part in path.split("*"))
+    return re.compile(pattern + ("$" if anchored else ""))
+
+
+class RobotsRules(object):
+    ''' The compiled rules of one robots.txt for one user agent.
+
+    The group of the longest user agent name found in our user agent is
+    used, or the "*" group if none is. As in RFC 9309, the rule with the
+    longest path that matches the path and query of a url decides, and
+    allow wins a tie. '''
+    def __init__(self, rules=(), crawl_delay=0, sitemaps=()):
+        # (path length, allow, compiled path), longest and allow first, so
+        # the first match is the one that decides.
+        self.rules = sorted(
+            rules, key=lambda rule: (-rule[0], not rule[1]))
+        self.crawl_delay = crawl_delay
+        self.sitemaps = list(sitemaps)
+
+    @classmethod
+    def parse(cls, content, user_agent):
+        if isinstance(content, bytes):
+            content = content[:MAX_ROBOTS_SIZE].decode("utf-8", "replace")
+        user_agent = user_agent.lower()
+        groups = dict()
+        sitemaps = list()
+        agents = list()
+        in_rules = False
+        for line in content.splitlines():
+            field, _, value = line.split("#", 1)[0].partition(":")
+            field = field.strip().lower()
+            value = value.strip()
+            if field == "sitemap":
+                if value:
+                    sitemaps.append(value)
+                continue
+            if field == "user-agent":
+                # Consecutive user-agent lines share the rules after them.
+                if in_rules:
+                    agents = list()
+                    in_rules = False
+                agents.append(value.lower())
+                for agent in agents:
+                    groups.setdefault(agent, {"rules": [], "delay": 0})
+            elif field in ("allow", "disallow", "crawl-delay") and agents:
+                in_rules = True
+                for agent in agents:
+                    group = groups[agent]
+                    if field == "crawl-delay":
+                        try:
+                            group["delay"] = max(0, float(value))
+                        except ValueError:
+                            pass
+                    elif value:
+                        # An empty disallow allows everything, so it can
+                        # be skipped.
+                        group["rules"].append(
+                            (len(value), field == "allow",
+                             _rule_pattern(value)))
+        matches = [
+            agent for agent in groups if agent != "*" and agent in user_agent]
+        group = (
+            groups[max(matches, key=len)] if matches else groups.get("*"))
+        if group is None:
+            return cls(sitemaps=sitemaps)
+        return cls(group["rules"], group["delay"], sitemaps)
+
+    def allowed(self, url):
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        for _, allow, pattern in self.rules:
+            if pattern.match(path):
+                return allow
+        return True
+
+
+def parse_sitemap(content):
+    ''' Returns the page urls and the nested sitemap urls of a sitemap, in
+    XML (gzipped or not) or plain text with one url per line. '''
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        text = content.decode("utf-8", "replace")
+        return [
+            line.strip() for line in text.splitlines()
+            if line.strip().startswith(("http://", "https://"))], []
+    locs = [
+        element.text.strip() for element in root.iter()
+        if element.tag.endswith("loc") and element.text]
+    if root.tag.endswith("sitemapindex"):
+        return [], locs
+    return locs, []
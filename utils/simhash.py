@@ -0,0 +1,42 @@
+from hashlib import blake2b
+
+# BYTES_WITH_BIT[j] lists the byte values that have bit j set.
+BYTES_WITH_BIT = [
+    [byte for byte in range(256) if byte >> bit & 1] for bit in range(8)]
+
+
+def hash64(data):
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "little")
+
+
+def content_hash(content):
+    # blake2b reads bytes and memoryviews alike, without a copy.
+    return hash64(content)
+
+
+def simhash(frequencies):
+    ''' 64 bit SimHash of a page, with its tokens weighted by their count.
+
+    Instead of a loop over the 64 bits of every token hash, the weights
+    are summed per (byte position, byte value), and the weight of each
+    bit is added up from those 2048 sums at the end. '''
+    sums = [0] * 2048
+    total_weight = 0
+    for token, weight in frequencies.items():
+        h = blake2b(token.encode("utf-8"), digest_size=8).digest()
+        sums[h[0]] += weight
+        sums[256 + h[1]] += weight
+        sums[512 + h[2]] += weight
+        sums[768 + h[3]] += weight
+        sums[1024 + h[4]] += weight
+        sums[1280 + h[5]] += weight
+        sums[1536 + h[6]] += weight
+        sums[1792 + h[7]] += weight
+        total_weight += weight
+    fingerprint = 0
+    for position in range(8):
+        offset = 256 * position
+        for bit, values in enumerate(BYTES_WITH_BIT):
+            if 2 * sum(sums[offset + value] for value in values) > total_weight:
+                fingerprint |= 1 << (8 * position + bit)
+    return fingerprint
@@ -0,0 +1,32 @@
+class TopK(object):
+    ''' The k items with the highest counts, ties broken by the item.
+
+    Kept up to date by offering every item whose count changed. Counts
+    only grow, so an item outside the top k can only get in when it is
+    offered, and the result matches sorting all the counts. '''
+    def __init__(self, k):
+        self.k = k
+        self.top = dict()
+        # (-count, item) of the lowest ranked item in top.
+        self.floor = None
+
+    def offer(self, item, count):
+        key = (-count, item)
+        if item in self.top:
+            self.top[item] = count
+            if self.floor[1] == item:
+                self._update_floor()
+        elif len(self.top) < self.k:
+            self.top[item] = count
+            if self.floor is None or key > self.floor:
+                self.floor = key
+        elif key < self.floor:
+            del self.top[self.floor[1]]
+            self.top[item] = count
+            self._update_floor()
+
+    def _update_floor(self):
+        self.floor = max((-count, item) for item, count in self.top.items())
+
+    def items(self):
+        return sorted(self.top.items(), key=lambda item: (-item[1], item[0]))
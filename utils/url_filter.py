@@ -0,0 +1,150 @@
+import re
+from functools import lru_cache
+from urllib.parse import urlparse
+
+# The default rules are the ones scraper.is_valid used to build on every
+# call. Every list can be replaced from the [FILTER] section of the config.
+
+# valid domains, matched against the end of the netloc
+DOMAINS = [
+    ".ics.uci.edu", ".cs.uci.edu", ".informatics.uci.edu", ".stat.uci.edu",
+    "today.uci.edu/department/information_computer_sciences"]
+
+# plain substrings that reject a url when found in its path or query
+KEYWORDS = [
+    "do=", "action=", "date=", "upload", "download", "ical", "login",
+    "password", "export", "attachment", "share=", "format=", "makefile",
+    "calendar"]
+
+# regexes that reject a url when found anywhere in it (case sensitive)
+DEAD_PATTERNS = ["404", "not-found", "error", "page-not-found", "invalid"]
+
+# regexes that reject a url when found anywhere in it (case insensitive)
+DIRECTORY_PATTERNS = ["./pdf/."]
+
+# regexes that reject a url when they follow a "." in its path or query
+# (case insensitive)
+DOTTED_PATTERNS = [
+    "/pdf/", "calendar", "cart", "view", "edit", "facebook.com", ".json",
+    "ooad", "format=", "makefile", "date=", "share=", "do=", "action=",
+    "upload", "download", "ical", "login", "password", "export",
+    "attachment"]
+
+# extensions (regexes) that reject a url when its path ends with them
+PATH_EXTENSIONS = [
+    "css", "js", "bmp", "gif", "jpe?g", "ico", "png", "tiff?", "mid", "mp2",
+    "mp3", "mp4", "wav", "avi", "mov", "mpeg", "ram", "m4v", "mkv", "ogg",
+    "ogv", "pdf", "ps", "eps", "tex", "ppt", "pptx", "doc", "docx", "xls",
+    "xlsx", "names", "data", "dat", "exe", "bz2", "tar", "msi", "bin", "7z",
+    "psd", "dmg", "iso", "img", "epub", "dll", "cnf", "tgz", "sha1", "cpp",
+    "h", "cc", "defs", "inc", "odc", "sas", "ppsx", "apk", "asp", "c", "sql",
+    "thmx", "mso", "arff", "rtf", "jar", "csv", "txt", "php", "rm", "smil",
+    "wmv", "swf", "wma", "zip", "rar", "gz"]
+
+# extensions (regexes) that reject a url when its query ends with them
+QUERY_EXTENSIONS = PATH_EXTENSIONS + ["bw", "cnt", "bam"]
+
+
+def _alternation(patterns):
+    return "|".join(f"(?:{pattern})" for pattern in patterns)
+
+
+def _component_pattern(keywords, dotted_patterns, extensions):
+    # One regex per url component: the keywords as they are, then the
+    # dotted patterns and extensions ignoring case.
+    parts = list()
+    if keywords:
+        parts.append(_alternation(re.escape(keyword) for keyword in keywords))
+    if dotted_patterns:
+        parts.append(f"(?i:\\.(?:{_alternation(dotted_patterns)}))")
+    if extensions:
+        parts.append(f"(?i:\\.(?:{_alternation(extensions)})$)")
+    return re.compile("|".join(parts)) if parts else None
+
+
+def _url_pattern(dead_patterns, directory_patterns):
+    parts = list()
+    if dead_patterns:
+        parts.append(_alternation(dead_patterns))
+    if directory_patterns:
+        parts.append(f"(?i:{_alternation(directory_patterns)})")
+    return re.compile("|".join(parts)) if parts else None
+
+
+def _split_rule(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class UrlFilter(object):
+    ''' Compiled version of the crawl policy of scraper.is_valid.
+
+    The rules are compiled into three regexes, one for the whole url and
+    one each for the path and the query, and verdicts are memoized in a
+    bounded LRU cache keyed on the url. '''
+    def __init__(self, domains=DOMAINS, keywords=KEYWORDS,
+                 dead_patterns=DEAD_PATTERNS,
+                 directory_patterns=DIRECTORY_PATTERNS,
+                 dotted_patterns=DOTTED_PATTERNS,
+                 path_extensions=PATH_EXTENSIONS,
+                 query_extensions=QUERY_EXTENSIONS, cache_size=1 << 16):
+        self.domains = tuple(domains)
+        self.url_pattern = _url_pattern(dead_patterns, directory_patterns)
+        self.path_pattern = _component_pattern(
+            keywords, dotted_patterns, path_extensions)
+        self.query_pattern = _component_pattern(
+            keywords, dotted_patterns, query_extensions)
+        self.cache_size = cache_size
+        self.is_valid = lru_cache(maxsize=cache_size)(self._is_valid)
+
+    def __getstate__(self):
+        # The cache can not be pickled, the parse processes start their own.
+        state = self.__dict__.copy()
+        del state["is_valid"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.is_valid = lru_cache(maxsize=self.cache_size)(self._is_valid)
+
+    @classmethod
+    def from_config(cls, section):
+        ''' Builds the filter from a config section. Rules that are not in
+        the section keep their defaults. '''
+        rules = dict()
+        for option, name in (
+                ("DOMAINS", "domains"), ("KEYWORDS", "keywords"),
+                ("DEADPATTERNS", "dead_patterns"),
+                ("DIRECTORYPATTERNS", "directory_patterns"),
+                ("DOTTEDPATTERNS", "dotted_patterns"),
+                ("PATHEXTENSIONS", "path_extensions"),
+                ("QUERYEXTENSIONS", "query_extensions")):
+            if option in section:
+                rules[name] = _split_rule(section[option])
+        if "CACHESIZE" in section:
+            rules["cache_size"] = section.getint("CACHESIZE")
+        return cls(**rules)
+
+    def _is_valid(self, url):
+        try:
+            parsed = urlparse(url)
+
+            if parsed.scheme not in ("http", "https"):
+                return False
+
+            if not parsed.netloc.endswith(self.domains):
+                return False
+
+            if self.url_pattern and self.url_pattern.search(url):
+                return False
+
+            if self.path_pattern and self.path_pattern.search(parsed.path):
+                return False
+
+            if self.query_pattern and self.query_pattern.search(parsed.query):
+                return False
+
+            return True
+
+        except TypeError:
+            print ("TypeError for ", url)
+            raise